@@ -0,0 +1,280 @@
+"""
+A channel layer shared by every ASGI worker on one host.
+
+InMemoryChannelLayer only delivers within a process, so with several daphne
+workers a scan handled by one worker never reaches a teacher's socket held
+by another. SQLiteChannelLayer keeps messages and group memberships in a
+SQLite file (in WAL mode) that all workers open, so it needs no outside
+service:
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'ams.channel_layer.SQLiteChannelLayer',
+            'CONFIG': {'path': BASE_DIR / 'channels.sqlite3'},
+        }
+    }
+
+Messages expire after `expiry` seconds and group memberships after
+`group_expiry` seconds, as with the other channel layers. A channel holds at
+most `capacity` messages (or the matching `channel_capacity` entry): send()
+raises ChannelFull and group_send() skips full channels.
+
+All SQLite access goes through one connection owned by a dedicated worker
+thread, so close() really closes it. A send from the same process wakes the
+receiver at once; messages from other workers are found by polling, backing
+off from `poll_interval_min` to `poll_interval` seconds while a channel is
+idle. Every open socket polls (the teacher's live page and each student's
+notification socket), so an idle host runs about (sockets / poll_interval)
+small reads a second on that thread: 1000 sockets at the default 0.05s is
+20000 reads/s. Raise `poll_interval` when cross-worker latency matters less
+than that load.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS channel_messages ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' channel TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' body TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, id)',
+    'CREATE INDEX IF NOT EXISTS channel_messages_expires ON channel_messages (expires)',
+    'CREATE TABLE IF NOT EXISTS channel_groups ('
+    ' group_name TEXT NOT NULL,'
+    ' channel TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' PRIMARY KEY (group_name, channel))',
+    'CREATE INDEX IF NOT EXISTS channel_groups_expires ON channel_groups (expires)',
+]
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+
+    extensions = ['groups', 'flush']
+
+    # How often (in seconds) expired rows are deleted
+    cleanup_interval = 30
+
+    def __init__(
+        self,
+        path='channels.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.05,
+        poll_interval_min=0.002,
+        **kwargs
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = os.fspath(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.poll_interval_min = poll_interval_min
+        # Only ever used from this executor's single thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._conn = None
+        self._last_cleanup = 0
+        # channel -> {(event loop, asyncio.Event)} of coroutines in receive()
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+
+    # Storage
+
+    def _connection(self):
+        """Returns the connection, opening it and creating the schema on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _call(self, fn, *args):
+        """Runs fn(*args) on the connection's thread."""
+        return asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def _write(self, fn, *args):
+        """Runs fn(conn, *args) in an immediate (write-locked) transaction."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn, *args)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def _run(self, fn, *args):
+        return self._call(self._write, fn, *args)
+
+    def _wake(self, channels):
+        """Wakes coroutines in this process waiting to receive on channels."""
+        with self._waiters_lock:
+            waiters = [waiter for channel in channels for waiter in self._waiters.get(channel, ())]
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The receiver's loop has closed
+                pass
+
+    def _cleanup(self, conn, now):
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        conn.execute('DELETE FROM channel_messages WHERE expires < ?', (now,))
+        conn.execute('DELETE FROM channel_groups WHERE expires < ?', (now,))
+
+    def _insert(self, conn, channel, body, now):
+        """Queues body on channel; returns False if the channel is full."""
+        (queued,) = conn.execute(
+            'SELECT COUNT(*) FROM channel_messages WHERE channel = ? AND expires >= ?',
+            (channel, now)
+        ).fetchone()
+        if queued >= self.get_capacity(channel):
+            return False
+        conn.execute(
+            'INSERT INTO channel_messages (channel, expires, body) VALUES (?, ?, ?)',
+            (channel, now + self.expiry, body)
+        )
+        return True
+
+    def _send(self, conn, channel, body):
+        now = time.time()
+        self._cleanup(conn, now)
+        return self._insert(conn, channel, body, now)
+
+    def _group_send(self, conn, group, body):
+        """Queues body on every channel in group; returns the channels it reached."""
+        now = time.time()
+        self._cleanup(conn, now)
+        channels = [row[0] for row in conn.execute(
+            'SELECT channel FROM channel_groups WHERE group_name = ? AND expires >= ?',
+            (group, now)
+        )]
+        return [channel for channel in channels if self._insert(conn, channel, body, now)]
+
+    def _pop(self, conn, channel):
+        now = time.time()
+        row = conn.execute(
+            'SELECT id, body FROM channel_messages WHERE channel = ? AND expires >= ? ORDER BY id LIMIT 1',
+            (channel, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('DELETE FROM channel_messages WHERE id = ?', (row[0],))
+        return row[1]
+
+    def _has_message(self, channel):
+        # A plain read doesn't take the write lock, so idle polling is cheap
+        return self._connection().execute(
+            'SELECT 1 FROM channel_messages WHERE channel = ? AND expires >= ? LIMIT 1',
+            (channel, time.time())
+        ).fetchone() is not None
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        if not await self._run(self._send, channel, json.dumps(message)):
+            raise ChannelFull(channel)
+        self._wake([channel])
+
+    async def receive(self, channel):
+        """
+        Waits for the next message on a channel. Only one coroutine should
+        receive on a channel at a time.
+        """
+        assert self.valid_channel_name(channel)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._waiters_lock:
+            self._waiters.setdefault(channel, set()).add(waiter)
+        try:
+            delay = self.poll_interval_min
+            while True:
+                # Cleared before looking so a send in between still wakes us
+                waiter[1].clear()
+                if await self._call(self._has_message, channel):
+                    body = await self._run(self._pop, channel)
+                    if body is not None:
+                        return json.loads(body)
+                    delay = self.poll_interval_min
+                    continue
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), delay)
+                except asyncio.TimeoutError:
+                    delay = min(delay * 2, self.poll_interval)
+                else:
+                    delay = self.poll_interval_min
+        finally:
+            with self._waiters_lock:
+                waiters = self._waiters[channel]
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[channel]
+
+    async def new_channel(self, prefix='specific'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f'{prefix}.sqlite!{suffix}'
+
+    async def flush(self):
+        def flush(conn):
+            conn.execute('DELETE FROM channel_messages')
+            conn.execute('DELETE FROM channel_groups')
+        await self._run(flush)
+
+    async def close(self):
+        await self._call(self._close_connection)
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+
+        def add(conn):
+            conn.execute(
+                'INSERT INTO channel_groups (group_name, channel, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (group_name, channel) DO UPDATE SET expires = excluded.expires',
+                (group, channel, time.time() + self.group_expiry)
+            )
+        await self._run(add)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+
+        def discard(conn):
+            conn.execute('DELETE FROM channel_groups WHERE group_name = ? AND channel = ?', (group, channel))
+        await self._run(discard)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        self._wake(await self._run(self._group_send, group, json.dumps(message)))
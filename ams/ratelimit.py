@@ -0,0 +1,190 @@
+"""
+Admission control for hot endpoints.
+
+RateLimitMiddleware applies the rules in settings.RATE_LIMITS to the views
+named there:
+
+* MAX_CONCURRENT caps requests in flight per endpoint; extra requests get a
+  503 before any view code (or ORM query) runs.
+* ENDPOINT is a token bucket shared by all clients of the endpoint.
+* USER is a token bucket per client, keyed by the authenticated user (or IP
+  address for anonymous clients). The middleware must therefore come after
+  AuthenticationMiddleware; the user is only loaded once the concurrency
+  check has passed.
+
+Rates are written 'N/period', e.g. '10/m', meaning a burst of N requests
+refilled evenly over the period (s, m, h or d). Exceeding a bucket returns
+429 with a Retry-After header. Buckets live in process memory by default;
+set RATE_LIMITS['BACKEND'] to 'cache' to share them through the configured
+Django cache (approximate, since updates are not atomic).
+"""
+
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parses 'N/period' into (capacity, tokens refilled per second)."""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class LocalBuckets:
+    """Token buckets kept in this process."""
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.MAX_KEYS and key not in self._buckets:
+                self._buckets.clear()
+            self._buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else (1 - tokens) / refill
+
+
+class CacheBuckets:
+    """Token buckets kept in the default Django cache, shared by all workers."""
+
+    def take(self, key, capacity, refill, now):
+        cache_key = f'ratelimit:{key}'
+        tokens, updated = cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(cache_key, (tokens, now), timeout=math.ceil(capacity / refill) + 1)
+        return allowed, 0 if allowed else (1 - tokens) / refill
+
+
+class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        config = getattr(settings, 'RATE_LIMITS', {})
+        self.rules = {
+            view_name: {
+                'user': parse_rate(rule.get('USER')),
+                'endpoint': parse_rate(rule.get('ENDPOINT')),
+                'max_concurrent': rule.get('MAX_CONCURRENT'),
+            }
+            for view_name, rule in config.get('VIEWS', {}).items()
+        }
+        self.buckets = CacheBuckets() if config.get('BACKEND') == 'cache' else LocalBuckets()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        view_name, rule, response = self.admit(request)
+        if response is not None:
+            return response
+        try:
+            if rule is not None:
+                response = self.throttle(view_name, rule, self.client_key(request) if rule['user'] else None)
+            if response is not None:
+                return response
+            return self.get_response(request)
+        finally:
+            self.release(view_name)
+
+    async def __acall__(self, request):
+        view_name, rule, response = self.admit(request)
+        if response is not None:
+            return response
+        try:
+            if rule is not None:
+                # Loading request.user touches the database, which is sync-only
+                client_key = await sync_to_async(self.client_key)(request) if rule['user'] else None
+                response = self.throttle(view_name, rule, client_key)
+            if response is not None:
+                return response
+            return await self.get_response(request)
+        finally:
+            self.release(view_name)
+
+    def admit(self, request):
+        """
+        Applies the concurrency cap. Returns (view_name, rule, None) if the
+        request may proceed to throttle(), or (None, None, response) if it is
+        rejected. view_name and rule are None for views without a rule. The
+        caller must release() an admitted view_name once the request is done.
+        """
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            return None, None, None
+        rule = self.rules.get(view_name)
+        if rule is None:
+            return None, None, None
+
+        max_concurrent = rule['max_concurrent']
+        with self._lock:
+            in_flight = self._in_flight.get(view_name, 0)
+            if max_concurrent is not None and in_flight >= max_concurrent:
+                return None, None, self.reject(503, 'The server is busy. Please try again in a moment.', 1)
+            self._in_flight[view_name] = in_flight + 1
+        return view_name, rule, None
+
+    def throttle(self, view_name, rule, client_key):
+        """
+        Takes a token from the endpoint and client buckets of an admitted
+        request. Returns None if it may proceed, or a 429 response if either
+        bucket is empty.
+        """
+        now = time.time()
+        checks = [
+            (rule['endpoint'], view_name),
+            (rule['user'], f'{view_name}:{client_key}'),
+        ]
+        for rate, key in checks:
+            if rate is None:
+                continue
+            allowed, retry_after = self.buckets.take(key, *rate, now)
+            if not allowed:
+                return self.reject(429, 'Too many requests. Please slow down.', retry_after)
+        return None
+
+    def release(self, view_name):
+        if view_name is None:
+            return
+        with self._lock:
+            self._in_flight[view_name] -= 1
+
+    def client_key(self, request):
+        # Not the session cookie: a client could send a new one per request
+        user = request.user
+        if user.is_authenticated:
+            return f'user:{user.pk}'
+        return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+    def reject(self, status, message, retry_after):
+        response = JsonResponse({'success': False, 'message': message}, status=status)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
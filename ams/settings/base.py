@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 
 ASGI_APPLICATION = 'ams.asgi.application'
 
+# In-memory delivery only reaches sockets in the same process; deployments
+# with several workers use ams.channel_layer.SQLiteChannelLayer (see production.py)
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer'
@@ -57,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ams.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,6 +143,91 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'student.CustomUser'
 
+# Attendance scan path
+# 'uuid' stores each QR token as a QRCode row; 'signed' issues stateless
+# HMAC-signed tokens that are validated without touching the database
+QR_TOKEN_MODE = 'uuid'
+QR_TOKEN_ROTATION_SECONDS = 60
+# Leeway for signed tokens scanned just outside their window
+QR_TOKEN_CLOCK_SKEW_SECONDS = 5
+
+# Rendered QR images are cached per token for this long (seconds); it only
+# needs to outlive QR_TOKEN_ROTATION_SECONDS
+QR_IMAGE_CACHE_TTL = 120
+
+# Seconds a cached class roster is trusted before it is re-read from the database
+ENROLLMENT_CACHE_TTL = 300
+
+# Seconds a student's dashboard payload is cached; attendance, lecture and
+# enrollment changes drop it sooner (see student/dashboard.py). Invalidation
+# only reaches other processes through a shared cache, so deployments with
+# several workers configure CACHES (see production.py)
+STUDENT_DASHBOARD_CACHE_TTL = 600
+
+# Seconds a month of a student's attendance calendar is cached; attendance,
+# lecture and enrollment changes drop it sooner (see student/attendance_calendar.py)
+ATTENDANCE_CALENDAR_CACHE_TTL = 3600
+
+# 'direct' writes each scan in the request; 'batched' queues scans and writes
+# them with bulk_create from a background flusher (see student/ingestion.py).
+# Batches that still fail after MAX_RETRIES are appended to SPOOL_PATH and
+# written when the flusher next starts
+ATTENDANCE_INGESTION = {
+    'MODE': 'direct',
+    'FLUSH_SIZE': 200,
+    'FLUSH_INTERVAL_MS': 250,
+    'QUEUE_SIZE': 5000,
+    'ENQUEUE_TIMEOUT_MS': 50,
+    'MAX_RETRIES': 3,
+    'RETRY_BACKOFF_MS': 200,
+    'SPOOL_PATH': BASE_DIR / 'attendance_spool.jsonl',
+}
+
+# Attendance percentage below which find_defaulters lists a student
+DEFAULTER_THRESHOLD = 75
+
+# Rows fetched per database round trip by the streaming attendance exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Seconds a report JSON response is cached; entries are keyed by the
+# subject's summary version, so changes never serve stale data
+REPORT_CACHE_TTL = 300
+
+# 'inline' sends channel events and emails from the request; 'outbox' queues
+# them for the dispatch_notifications worker (see teacher/dispatcher.py)
+NOTIFICATIONS = {
+    'MODE': 'inline',
+    'BATCH_SIZE': 200,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF_SECONDS': 5,
+    'LEASE_SECONDS': 60,
+    'POLL_INTERVAL_MS': 500,
+    'RETENTION_HOURS': 24,
+}
+
+# Live lecture page: changes are batched into one WebSocket frame per window.
+# Set ATTENDANCE_WS_LOGGING to log each frame (logger 'teacher.consumers')
+ATTENDANCE_WS_BATCH_WINDOW_MS = 150
+ATTENDANCE_WS_LOGGING = False
+
+# Per-endpoint admission control (see ams/ratelimit.py). Rates are 'N/period'
+# token buckets; BACKEND 'cache' shares buckets through the Django cache
+RATE_LIMITS = {
+    'BACKEND': 'local',
+    'VIEWS': {
+        'student:mark_attendance': {'USER': '10/m', 'ENDPOINT': '6000/m', 'MAX_CONCURRENT': 200},
+        'student:mark_attendance_async': {'USER': '10/m', 'ENDPOINT': '6000/m', 'MAX_CONCURRENT': 200},
+        'teacher:search_students': {'USER': '60/m', 'MAX_CONCURRENT': 20},
+    },
+}
+
+# Budgets enforced by `manage.py bench_scan`; None disables a check
+SCAN_BENCHMARK_BUDGET = {
+    'P95_MS': None,
+    'P99_MS': None,
+    'ERROR_RATE': 0.0,
+}
+
 # Email settings
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -9,3 +9,29 @@ STATIC_URL = '/static/'
 STATIC_ROOT = '/home/Yameen/AttendanceManagementSystem/staticfiles'
 
 STATICFILES_DIRS = []
+
+# Several ASGI workers share one host, so they need a cross-process channel
+# layer for scans handled by one worker to reach sockets held by another
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'ams.channel_layer.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': BASE_DIR / 'channels.sqlite3',
+        },
+    }
+}
+
+# The default local-memory cache is per process, so an invalidation made by
+# one worker would leave the others serving stale dashboards, calendars and
+# QR images until their TTLs ran out. A file cache is shared by every worker
+# on the host without an outside service
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            # One dashboard payload and a few calendar months per student
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+
+from .channel_layer import SQLiteChannelLayer
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'channels.sqlite3')
+
+    def layer(self, **config):
+        layer = SQLiteChannelLayer(path=self.path, **config)
+        self.addCleanup(layer._executor.shutdown)
+        return layer
+
+    async def receive(self, layer, channel, timeout=1):
+        return await asyncio.wait_for(layer.receive(channel), timeout)
+
+    async def test_send_and_receive_in_order(self):
+        layer = self.layer()
+        await layer.send('lecture.1', {'type': 'first'})
+        await layer.send('lecture.1', {'type': 'second'})
+        self.assertEqual(await self.receive(layer, 'lecture.1'), {'type': 'first'})
+        self.assertEqual(await self.receive(layer, 'lecture.1'), {'type': 'second'})
+        await layer.close()
+
+    async def test_send_wakes_a_waiting_receiver(self):
+        # A long poll interval so only the wakeup can deliver in time
+        layer = self.layer(poll_interval=10, poll_interval_min=10)
+        receiving = asyncio.ensure_future(self.receive(layer, 'lecture.1'))
+        await asyncio.sleep(0.05)
+        await layer.send('lecture.1', {'type': 'scan'})
+        self.assertEqual(await receiving, {'type': 'scan'})
+        await layer.close()
+
+    async def test_group_send_reaches_members_across_layers(self):
+        sender, receiver = self.layer(), self.layer(poll_interval=0.01)
+        await receiver.group_add('lecture_1', 'teacher.a')
+        await receiver.group_add('lecture_1', 'teacher.b')
+        await receiver.group_add('lecture_2', 'teacher.c')
+        await receiver.group_discard('lecture_1', 'teacher.b')
+
+        await sender.group_send('lecture_1', {'type': 'scan'})
+        self.assertEqual(await self.receive(receiver, 'teacher.a'), {'type': 'scan'})
+        for channel in ('teacher.b', 'teacher.c'):
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.receive(receiver, channel, timeout=0.1)
+        await sender.close()
+        await receiver.close()
+
+    async def test_new_channel_names_are_valid_and_distinct(self):
+        layer = self.layer()
+        first, second = await layer.new_channel(), await layer.new_channel()
+        self.assertNotEqual(first, second)
+        self.assertRegex(first, r'^specific\.sqlite![A-Za-z]{12}$')
+        self.assertTrue(layer.valid_channel_name(first))
+        await layer.send(first, {'type': 'scan'})
+        self.assertEqual(await self.receive(layer, first), {'type': 'scan'})
+        await layer.close()
+
+    async def test_messages_expire(self):
+        layer = self.layer(expiry=0.05, poll_interval=0.01)
+        await layer.send('lecture.1', {'type': 'scan'})
+        await asyncio.sleep(0.1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receive(layer, 'lecture.1', timeout=0.1)
+        await layer.close()
+
+    async def test_full_channel_raises(self):
+        layer = self.layer(capacity=1)
+        await layer.send('lecture.1', {'type': 'scan'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('lecture.1', {'type': 'scan'})
+        await layer.close()
+
+    async def test_close_closes_the_connection(self):
+        layer = self.layer()
+        await layer.send('lecture.1', {'type': 'scan'})
+        conn = layer._conn
+        await layer.close()
+        self.assertIsNone(layer._conn)
+        with self.assertRaisesMessage(sqlite3.ProgrammingError, 'closed'):
+            await layer._call(conn.execute, 'SELECT 1')
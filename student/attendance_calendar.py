@@ -0,0 +1,111 @@
+"""
+Month-bucketed attendance calendar for students.
+
+Each month of a student's calendar (their active-session lectures, marked
+present when the attendance was approved) is read with one query and cached
+under (student, month), so a calendar scrolled back and forth across a term
+only queries months it has not seen yet.
+
+Cached months are keyed by two tokens: the student's, replaced when their
+approved attendance, enrollments or their classes' lectures change, and a
+global one replaced when a session is activated. Replacing a token makes
+every month cached under the old one unreachable at once. Tokens replaced
+by one worker process are only seen by the others when the default cache is
+shared between them (see ams/settings/production.py).
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+from teacher.models import Attendance, Lecture
+
+GLOBAL_TOKEN_KEY = 'attendance_calendar:token'
+
+
+def _ttl():
+    return getattr(settings, 'ATTENDANCE_CALENDAR_CACHE_TTL', 3600)
+
+
+def _student_token_key(student_id):
+    return f'attendance_calendar:token:{student_id}'
+
+
+def _tokens(student_id):
+    keys = [GLOBAL_TOKEN_KEY, _student_token_key(student_id)]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            # Never set, or evicted: a fresh token can't match old entries
+            cache.add(key, uuid.uuid4().hex, None)
+            tokens[key] = cache.get(key)
+    return [tokens[key] for key in keys]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def months_between(start, end):
+    """The first days of the months from start's to end's, inclusive."""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = next_month(month)
+
+
+def build_month(student, month):
+    """[(lecture date, present)] for a student's lectures in a month, in one query."""
+    return [
+        (lecture_date.isoformat(), present)
+        for lecture_date, present in Lecture.objects.filter(
+            subject__class_obj__session__is_active=True,
+            subject__class_obj__students=student,
+            date__gte=month,
+            date__lt=next_month(month),
+        ).annotate(
+            present=Exists(Attendance.objects.filter(student=student, lecture=OuterRef('pk'), status='approved'))
+        ).order_by('date', 'time').values_list('date', 'present')
+    ]
+
+
+def get_months(student, months):
+    """{month: build_month(student, month)}, taking what it can from the cache."""
+    prefix = 'attendance_calendar:{}:{}:{}'.format(*_tokens(student.pk), student.pk)
+    keys = {month: f'{prefix}:{month:%Y-%m}' for month in months}
+    cached = cache.get_many(keys.values())
+
+    result, missing = {}, {}
+    for month, key in keys.items():
+        if key in cached:
+            result[month] = cached[key]
+        else:
+            result[month] = missing[key] = build_month(student, month)
+    if missing:
+        cache.set_many(missing, _ttl())
+    return result
+
+
+def event(lecture_date, present):
+    """A FullCalendar event for one lecture."""
+    return {
+        'title': 'Present' if present else 'Absent',
+        'start': lecture_date,
+        'allDay': True,
+        'color': '#28a745' if present else '#dc3545',
+    }
+
+
+def invalidate_students(student_ids):
+    cache.set_many({_student_token_key(student_id): uuid.uuid4().hex for student_id in student_ids}, None)
+
+
+def invalidate_all():
+    cache.set(GLOBAL_TOKEN_KEY, uuid.uuid4().hex, None)
@@ -42,6 +42,12 @@ class GeneralConsumer(AsyncWebsocketConsumer):
             'message': message
         }))
 
+    async def attendance_status_batch(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'attendance.status.batch',
+            'messages': event['messages']
+        }))
+
     async def notification(self, event):
         message = event['message']
         await self.send(text_data=json.dumps({
@@ -0,0 +1,104 @@
+"""
+Cached per-student dashboard payloads.
+
+A student's dashboard lists their classes in the active session with an
+attendance percentage each. The payload is built from the attendance
+summary tables (see teacher.summary) in two queries and cached per student,
+so repeat visits don't touch the database.
+
+Entries are dropped when the student's approved attendance or enrollments
+change, or when a lecture is added to or removed from one of their classes.
+Changes that affect everyone (a session activated, a class or course
+renamed) move the generation that every key includes instead. Both only
+reach other worker processes when the default cache is shared between them
+(see ams/settings/production.py).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from teacher.models import AcademicSession, StudentSubjectSummary, SubjectSummary
+
+GENERATION_KEY = 'student_dashboard:generation'
+
+
+def _ttl():
+    return getattr(settings, 'STUDENT_DASHBOARD_CACHE_TTL', 600)
+
+
+def _key(student_id, generation):
+    return f'student_dashboard:{generation}:{student_id}'
+
+
+def _generation():
+    return cache.get(GENERATION_KEY, 0)
+
+
+def _class_total(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(subject__class_obj=OuterRef('pk'))
+        .values('subject__class_obj').annotate(total=Sum(field)).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def build(student):
+    """
+    Returns the dashboard's enrollments as plain data, or None when there is
+    no active session. Each enrollment has class_obj (id, name and
+    course.name) and attendance_percentage.
+    """
+    try:
+        active_session = AcademicSession.objects.get(is_active=True)
+    except AcademicSession.DoesNotExist:
+        return None
+
+    classes = student.enrolled_classes.filter(session=active_session).select_related('course').annotate(
+        total_lectures=_class_total(SubjectSummary.objects.all(), 'lecture_count'),
+        attended_lectures=_class_total(StudentSubjectSummary.objects.filter(student=student), 'approved_count'),
+    )
+    enrollments = []
+    for class_obj in classes:
+        if class_obj.total_lectures > 0:
+            attendance_percentage = (class_obj.attended_lectures / class_obj.total_lectures) * 100
+        else:
+            attendance_percentage = 0
+        enrollments.append({
+            'class_obj': {
+                'id': class_obj.id,
+                'name': class_obj.name,
+                'course': {'name': class_obj.course.name},
+            },
+            'attendance_percentage': round(attendance_percentage),
+        })
+    return enrollments
+
+
+def get(student):
+    """build(student), from the cache when it is current."""
+    key = _key(student.pk, _generation())
+    payload = cache.get(key)
+    if payload is None:
+        payload = build(student)
+        if payload is None:
+            # Not cached: the page should notice a session being activated
+            return None
+        cache.set(key, payload, _ttl())
+    return payload
+
+
+def invalidate_students(student_ids):
+    generation = _generation()
+    cache.delete_many([_key(student_id, generation) for student_id in student_ids])
+
+
+def invalidate_all():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Not set yet, or evicted: start from a value no earlier key used
+        cache.set(GENERATION_KEY, time.time_ns(), None)
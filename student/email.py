@@ -1,6 +1,5 @@
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.conf import settings
+from teacher import notifications
 
 def send_attendance_confirmation_email(student, lecture):
     """
@@ -24,13 +23,8 @@ def send_attendance_confirmation_email(student, lecture):
     body = render_to_string('student/email/attendance_confirmation.txt', context)
     
     try:
-        send_mail(
-            subject,
-            body,
-            settings.DEFAULT_FROM_EMAIL, # Use default from email
-            [student.email],
-            fail_silently=False,
-        )
+        # Queued for the dispatch_notifications worker in outbox mode
+        notifications.send_email(subject, body, [student.email])
     except Exception as e:
         # Log the exception in a real application
         print(f"Error sending email to {student.email}: {e}")
@@ -0,0 +1,282 @@
+"""
+Write-behind ingestion of attendance scans.
+
+When ATTENDANCE_INGESTION['MODE'] is 'batched', mark_attendance validates a
+scan and hands it to a bounded in-process queue instead of writing it
+itself. A background flusher inserts queued scans with one bulk_create every
+FLUSH_INTERVAL_MS or FLUSH_SIZE rows, whichever comes first, and sends one
+coalesced event per lecture to the teacher's live page. A full queue rejects
+new scans so callers can ask the student to retry; pending scans are flushed
+when the process exits.
+
+A batch that cannot be written is retried MAX_RETRIES times with exponential
+backoff. If it still fails, it is appended to the SPOOL_PATH file so no
+acknowledged scan is lost; the flusher requeues spooled scans when it starts.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from teacher import notifications
+from teacher.models import Attendance
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'direct',
+    'FLUSH_SIZE': 200,
+    'FLUSH_INTERVAL_MS': 250,
+    'QUEUE_SIZE': 5000,
+    'ENQUEUE_TIMEOUT_MS': 50,
+    'MAX_RETRIES': 3,
+    'RETRY_BACKOFF_MS': 200,
+    'SPOOL_PATH': None,
+}
+
+Scan = namedtuple('Scan', ['student_id', 'student_name', 'lecture_id', 'subject_id', 'date'])
+
+_STOP = object()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ATTENDANCE_INGESTION', {})}
+
+
+def is_batched():
+    return get_config()['MODE'] == 'batched'
+
+
+class ScanIngestor:
+    def __init__(self, queue_size, flush_size, flush_interval, enqueue_timeout,
+                 max_retries=0, retry_backoff=0, spool_path=None):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spool_path = spool_path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='scan-ingestor', daemon=True)
+                self._thread.start()
+
+    def submit(self, scan):
+        """Queues a scan. Returns False when the queue stays full (backpressure)."""
+        self.start()
+        try:
+            self._queue.put(scan, timeout=self.enqueue_timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def stop(self, timeout=None):
+        """Flushes everything still queued and stops the flusher thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._requeue_spooled()
+            stopping = False
+            while not stopping:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                if first is _STOP:
+                    break
+
+                batch = [first]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.flush_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        scan = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if scan is _STOP:
+                        stopping = True
+                        break
+                    batch.append(scan)
+                self._flush(batch)
+
+            # Drain whatever was queued before the stop request
+            batch = []
+            while True:
+                try:
+                    scan = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if scan is not _STOP:
+                    batch.append(scan)
+            for start in range(0, len(batch), self.flush_size):
+                self._flush(batch[start:start + self.flush_size])
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        for attempt in range(self.max_retries + 1):
+            close_old_connections()
+            try:
+                created = write_scans(batch)
+                break
+            except Exception:
+                logger.exception(
+                    'Failed to write %d queued attendance scans (attempt %d of %d)',
+                    len(batch), attempt + 1, self.max_retries + 1,
+                )
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+        else:
+            self._spool(batch)
+            return
+        try:
+            broadcast_scans(created)
+        except Exception:
+            logger.exception('Failed to broadcast %d attendance scans', len(created))
+
+    def _spool(self, batch):
+        """Appends scans that could not be written to the spool file."""
+        if self.spool_path is None:
+            logger.error('Dropping %d attendance scans: no spool file is configured', len(batch))
+            return
+        try:
+            with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                for scan in batch:
+                    spool.write(json.dumps({**scan._asdict(), 'date': scan.date.isoformat()}) + '\n')
+                spool.flush()
+                os.fsync(spool.fileno())
+        except OSError:
+            logger.exception('Dropping %d attendance scans: the spool file could not be written', len(batch))
+        else:
+            logger.error('Spooled %d attendance scans to %s', len(batch), self.spool_path)
+
+    def _requeue_spooled(self):
+        """Writes scans spooled by an earlier run before taking new ones."""
+        if self.spool_path is None or not os.path.exists(self.spool_path):
+            return
+        # Claim the file first so scans spooled again below start a new one
+        claimed = f'{self.spool_path}.{os.getpid()}'
+        try:
+            os.replace(self.spool_path, claimed)
+            with open(claimed, encoding='utf-8') as spool:
+                batch = [
+                    Scan(**{**row, 'date': datetime.date.fromisoformat(row['date'])})
+                    for row in map(json.loads, filter(str.strip, spool))
+                ]
+        except (OSError, ValueError, TypeError):
+            logger.exception('Could not read spooled attendance scans from %s', self.spool_path)
+            return
+        logger.info('Requeueing %d spooled attendance scans', len(batch))
+        for start in range(0, len(batch), self.flush_size):
+            self._flush(batch[start:start + self.flush_size])
+        os.remove(claimed)
+
+
+def write_scans(batch):
+    """
+    Inserts a batch of scans, skipping students who already have a record
+    for the lecture. Returns (scan, attendance_id) pairs for the new rows.
+    """
+    unique = {}
+    for scan in batch:
+        unique.setdefault((scan.student_id, scan.lecture_id), scan)
+
+    lecture_ids = {lecture_id for _, lecture_id in unique}
+    student_ids = {student_id for student_id, _ in unique}
+    existing = set(
+        Attendance.objects.filter(lecture_id__in=lecture_ids, student_id__in=student_ids)
+        .values_list('student_id', 'lecture_id')
+    )
+
+    new_scans = [scan for key, scan in unique.items() if key not in existing]
+    if not new_scans:
+        return []
+
+    # Another process may insert the same scan concurrently; the unique
+    # constraint turns that into a skipped row rather than an error
+    Attendance.objects.bulk_create([
+        Attendance(
+            student_id=scan.student_id,
+            lecture_id=scan.lecture_id,
+            subject_id=scan.subject_id,
+            date=scan.date,
+            status='pending',
+        )
+        for scan in new_scans
+    ], ignore_conflicts=True)
+
+    ids = {
+        (student_id, lecture_id): attendance_id
+        for attendance_id, student_id, lecture_id in Attendance.objects.filter(
+            lecture_id__in=lecture_ids, student_id__in={scan.student_id for scan in new_scans}
+        ).values_list('id', 'student_id', 'lecture_id')
+    }
+    return [
+        (scan, ids[(scan.student_id, scan.lecture_id)])
+        for scan in new_scans
+        if (scan.student_id, scan.lecture_id) in ids
+    ]
+
+
+def broadcast_scans(created):
+    """Sends one event per lecture for newly created rows."""
+    by_lecture = defaultdict(list)
+    for scan, attendance_id in created:
+        by_lecture[scan.lecture_id].append({
+            'student_name': scan.student_name,
+            'attendance_id': attendance_id,
+            'status': 'pending',
+        })
+    notifications.publish([
+        (notifications.lecture_group(lecture_id), notifications.lecture_event(updates))
+        for lecture_id, updates in by_lecture.items()
+    ])
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            config = get_config()
+            _ingestor = ScanIngestor(
+                queue_size=config['QUEUE_SIZE'],
+                flush_size=config['FLUSH_SIZE'],
+                flush_interval=config['FLUSH_INTERVAL_MS'] / 1000,
+                enqueue_timeout=config['ENQUEUE_TIMEOUT_MS'] / 1000,
+                max_retries=config['MAX_RETRIES'],
+                retry_backoff=config['RETRY_BACKOFF_MS'] / 1000,
+                spool_path=config['SPOOL_PATH'] or settings.BASE_DIR / 'attendance_spool.jsonl',
+            )
+            atexit.register(_ingestor.stop)
+        return _ingestor
+
+
+def submit(scan):
+    return get_ingestor().submit(scan)
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from student import ingestion
+from student.models import CustomUser
+from teacher import tokens
+from teacher.models import AcademicSession, Attendance, Class, Course, Lecture, Subject
+
+CSRF_TOKEN = 'benchscancsrftoken00000000000000'
+
+VIEWS = {
+    'sync': 'student:mark_attendance',
+    'async': 'student:mark_attendance_async',
+}
+
+
+class QueryCounter:
+    """Counts queries on every database connection, whichever thread opened it."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the scan endpoints with a whole class scanning one QR code at once, '
+        'through the ASGI app on a throwaway SQLite database. Fails when a latency or error budget is exceeded.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--students',
+            type=int,
+            default=500,
+            help='The number of enrolled students scanning concurrently.'
+        )
+        parser.add_argument(
+            '--views',
+            default='sync,async',
+            help='Comma-separated scan views to benchmark: sync, async.'
+        )
+        parser.add_argument(
+            '--max-p95-ms',
+            type=float,
+            default=getattr(settings, 'SCAN_BENCHMARK_BUDGET', {}).get('P95_MS'),
+            help='Fail if any view\'s p95 latency exceeds this many milliseconds.'
+        )
+        parser.add_argument(
+            '--max-p99-ms',
+            type=float,
+            default=getattr(settings, 'SCAN_BENCHMARK_BUDGET', {}).get('P99_MS'),
+            help='Fail if any view\'s p99 latency exceeds this many milliseconds.'
+        )
+        parser.add_argument(
+            '--max-error-rate',
+            type=float,
+            default=getattr(settings, 'SCAN_BENCHMARK_BUDGET', {}).get('ERROR_RATE', 0.0),
+            help='Fail if the fraction of failed scans exceeds this (0.0 - 1.0).'
+        )
+        parser.add_argument(
+            '--rate-limits',
+            action='store_true',
+            help='Keep RATE_LIMITS active, so shed and throttled scans count as errors.'
+        )
+
+    def handle(self, *args, **options):
+        views = [view.strip() for view in options['views'].split(',') if view.strip()]
+        for view in views:
+            if view not in VIEWS:
+                self.stderr.write(self.style.ERROR(f"Unknown view '{view}'. Choose from: {', '.join(VIEWS)}."))
+                return
+
+        # A file database (rather than in-memory) lets concurrent request
+        # threads wait on SQLite's write lock instead of failing immediately
+        db_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        db_file.close()
+        connection.settings_dict['TEST']['NAME'] = db_file.name
+        connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+
+        # Every simulated student scans once, so the per-endpoint concurrency
+        # cap would only measure the limiter unless explicitly requested
+        rate_limits = None if options['rate_limits'] else override_settings(RATE_LIMITS={})
+        if rate_limits is not None:
+            rate_limits.enable()
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        counter.install(connection=connection)
+        try:
+            students, subject = self.seed(options['students'])
+            cookies = self.login(students)
+            results = []
+            for view in views:
+                lecture = Lecture.objects.create(subject=subject, date=timezone.now().date(), time=timezone.now().time())
+                queries_before = counter.count
+                result = asyncio.run(self.scan_storm(VIEWS[view], lecture, cookies))
+                if ingestion.is_batched():
+                    # Count rows only once the write-behind queue is drained
+                    ingestion.get_ingestor().stop()
+                result['queries'] = counter.count - queries_before
+                result['rows_written'] = Attendance.objects.filter(lecture=lecture).count()
+                self.report(view, result)
+                results.append((view, result))
+        finally:
+            connection_created.disconnect(counter.install)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if rate_limits is not None:
+                rate_limits.disable()
+            if os.path.exists(db_file.name):
+                os.remove(db_file.name)
+
+        self.check_budget(results, options)
+
+    def seed(self, count):
+        session = AcademicSession.objects.create(name='Benchmark', start_date=timezone.now().date(), end_date=timezone.now().date())
+        course = Course.objects.create(name='Benchmark Course')
+        class_obj = Class.objects.create(name='Benchmark Class', course=course, session=session)
+        teacher = CustomUser.objects.create(email='teacher@bench.local', name='Teacher', role='Teacher', password=make_password(None))
+        subject = Subject.objects.create(name='Benchmark Subject', class_obj=class_obj, teacher=teacher)
+
+        password = make_password(None)
+        students = CustomUser.objects.bulk_create([
+            CustomUser(email=f'student{i}@bench.local', name=f'Student {i}', role='Student', password=password)
+            for i in range(count)
+        ])
+        class_obj.students.add(*students)
+        return students, subject
+
+    def login(self, students):
+        cookies = []
+        for student in students:
+            session = SessionStore()
+            session[SESSION_KEY] = str(student.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = student.get_session_auth_hash()
+            session.create()
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={CSRF_TOKEN}')
+        return cookies
+
+    async def scan_storm(self, url_name, lecture, cookies):
+        from channels.testing import HttpCommunicator
+        from ams.asgi import application
+
+        lecture = await Lecture.objects.select_related('subject__class_obj').aget(pk=lecture.pk)
+        qr_code_data, _ = await asyncio.to_thread(tokens.issue_token, lecture)
+        path = reverse(url_name)
+        body = json.dumps({'qr_code_data': qr_code_data}).encode()
+
+        async def scan(cookie):
+            communicator = HttpCommunicator(application, 'POST', path, body=body, headers=[
+                (b'host', b'testserver'),
+                (b'cookie', cookie.encode()),
+                (b'x-csrftoken', CSRF_TOKEN.encode()),
+                (b'content-type', b'application/json'),
+            ])
+            started = time.perf_counter()
+            try:
+                response = await communicator.get_response(timeout=120)
+                succeeded = response['status'] == 200 and json.loads(response['body']).get('success', False)
+            except Exception:
+                succeeded = False
+            return time.perf_counter() - started, succeeded
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(scan(cookie) for cookie in cookies))
+        elapsed = time.perf_counter() - started
+        return {
+            'scans': len(results),
+            'failed': sum(1 for _, succeeded in results if not succeeded),
+            'latencies_ms': sorted(latency * 1000 for latency, _ in results),
+            'elapsed': elapsed,
+        }
+
+    def report(self, view, result):
+        scans = result['scans']
+        latencies = result['latencies_ms']
+        result['p50'] = percentile(latencies, 50)
+        result['p95'] = percentile(latencies, 95)
+        result['p99'] = percentile(latencies, 99)
+        result['error_rate'] = result['failed'] / scans if scans else 0.0
+        queries_per_scan = result['queries'] / scans if scans else 0.0
+        scans_per_second = scans / result['elapsed'] if result['elapsed'] else 0.0
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{view} ({reverse(VIEWS[view])})'))
+        self.stdout.write(f"  scans:               {scans} in {result['elapsed']:.2f}s ({scans_per_second:.0f}/s)")
+        self.stdout.write(f"  latency p50/p95/p99: {result['p50']:.1f} / {result['p95']:.1f} / {result['p99']:.1f} ms")
+        self.stdout.write(f"  error rate:          {result['error_rate']:.2%} ({result['failed']} failed)")
+        self.stdout.write(f"  queries per scan:    {queries_per_scan:.2f}")
+        self.stdout.write(f"  rows written:        {result['rows_written']}")
+
+    def check_budget(self, results, options):
+        failures = []
+        for view, result in results:
+            if options['max_p95_ms'] is not None and result['p95'] > options['max_p95_ms']:
+                failures.append(f"{view}: p95 {result['p95']:.1f} ms > {options['max_p95_ms']:.1f} ms")
+            if options['max_p99_ms'] is not None and result['p99'] > options['max_p99_ms']:
+                failures.append(f"{view}: p99 {result['p99']:.1f} ms > {options['max_p99_ms']:.1f} ms")
+            if result['error_rate'] > options['max_error_rate']:
+                failures.append(f"{view}: error rate {result['error_rate']:.2%} > {options['max_error_rate']:.2%}")
+
+        if failures:
+            raise CommandError('Scan benchmark budget exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Scan benchmark within budget.'))
@@ -1,3 +1,240 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date, time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from ams.ratelimit import RateLimitMiddleware
+from teacher import tokens
+from teacher.models import AcademicSession, Attendance, Class, Course, Lecture, Subject
+
+from . import ingestion
+from .models import CustomUser
+
+
+class StudentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = AcademicSession.objects.create(name='2025-2026', start_date=date(2025, 6, 1), end_date=date(2026, 5, 31))
+        course = Course.objects.create(name='B.Sc. Computer Science')
+        teacher = CustomUser.objects.create_user(email='teacher@example.com', password='password', name='Teacher', role='Teacher')
+        self.student = CustomUser.objects.create_user(email='student@example.com', password='password', name='Student', role='Student')
+        self.classes = [Class.objects.create(name=name, course=course, session=session) for name in ('FY', 'SY', 'TY')]
+        self.lectures = []
+        for class_obj in self.classes:
+            class_obj.students.add(self.student)
+            subject = Subject.objects.create(name=f'Mathematics {class_obj.name}', class_obj=class_obj, teacher=teacher)
+            self.lectures.append([
+                Lecture.objects.create(subject=subject, date=date(2025, 7, day), time=time(10))
+                for day in (1, 2, 3, 4)
+            ])
+        self.client.force_login(self.student)
+
+    def attend(self, lecture, status='approved'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Attendance.objects.create(
+                student=self.student, lecture=lecture, subject=lecture.subject, date=lecture.date, status=status
+            )
+
+
+class StudentDashboardTests(StudentTestCase):
+    def percentages(self):
+        response = self.client.get(reverse('student:student_dashboard'))
+        return {enrollment['class_obj']['name']: enrollment['attendance_percentage'] for enrollment in response.context['enrollments']}
+
+    def test_query_count_does_not_grow_with_classes(self):
+        url = reverse('student:student_dashboard')
+        self.client.get(url)
+        cache.clear()
+        with self.assertNumQueries(4):  # session, user, active session, classes
+            self.client.get(url)
+        # Cached: only the session and user lookups remain
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_cached_dashboard_follows_attendance_and_lectures(self):
+        self.assertEqual(self.percentages(), {'FY': 0, 'SY': 0, 'TY': 0})
+
+        attendance = self.attend(self.lectures[0][0])
+        self.assertEqual(self.percentages(), {'FY': 25, 'SY': 0, 'TY': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance.status = 'rejected'
+            attendance.save()
+        self.attend(self.lectures[1][0])
+        self.assertEqual(self.percentages(), {'FY': 0, 'SY': 25, 'TY': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lectures[1][1].delete()
+        self.assertEqual(self.percentages(), {'FY': 0, 'SY': 33, 'TY': 0})
+
+        self.classes[2].students.remove(self.student)
+        self.assertEqual(self.percentages(), {'FY': 0, 'SY': 33})
+
+
+class AttendanceCalendarTests(StudentTestCase):
+    def events(self, **params):
+        return self.client.get(reverse('student:get_attendance_calendar_data'), params).json()
+
+    def test_months_are_cached_until_attendance_changes(self):
+        url = reverse('student:get_attendance_calendar_data')
+        with self.assertNumQueries(3):  # session, user, July
+            month = self.events(month='2025-07')
+        self.assertEqual(len(month['events']), 12)
+        self.assertEqual({event['title'] for event in month['events']}, {'Absent'})
+
+        # Scrolling back over a cached month only fetches the new one
+        with self.assertNumQueries(3):
+            self.client.get(url, {'start': '2025-06-29', 'end': '2025-07-02'})
+        with self.assertNumQueries(2):
+            self.client.get(url, {'start': '2025-06-29', 'end': '2025-07-02'})
+
+        self.attend(self.lectures[0][0])
+        events = self.events(start='2025-07-01', end='2025-07-01')
+        self.assertEqual(sorted(event['title'] for event in events), ['Absent', 'Absent', 'Present'])
+
+    def test_rescheduled_lecture_moves(self):
+        self.events(month='2025-07')
+        with self.captureOnCommitCallbacks(execute=True):
+            lecture = self.lectures[0][0]
+            lecture.date = date(2025, 8, 1)
+            lecture.save()
+        self.assertEqual(len(self.events(month='2025-07')['events']), 11)
+        self.assertEqual(len(self.events(month='2025-08')['events']), 1)
+
+
+    def test_deleted_subject_leaves_the_calendar(self):
+        self.events(month='2025-07')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lectures[0][0].subject.delete()
+        self.assertEqual(len(self.events(month='2025-07')['events']), 8)
+
+class AttendanceByDateTests(StudentTestCase):
+    def test_range_groups_lectures_by_day(self):
+        self.attend(self.lectures[1][0])
+        with self.assertNumQueries(4) as queries:  # session, user, lectures, attendance
+            response = self.client.get(reverse('student:get_attendance_by_date_range'), {'start': '2025-07-01', 'end': '2025-07-31'})
+        days = response.json()['days']
+        self.assertEqual(sorted(days), ['2025-07-01', '2025-07-02', '2025-07-03', '2025-07-04'])
+        # Attended lectures are matched with a subquery, not one parameter per lecture
+        self.assertIn('IN (SELECT', queries.captured_queries[-1]['sql'])
+        self.assertEqual(
+            sorted((lecture['subject'], lecture['status']) for lecture in days['2025-07-01']),
+            [('Mathematics FY', 'Absent'), ('Mathematics SY', 'Present'), ('Mathematics TY', 'Absent')],
+        )
+
+    def test_single_day_keeps_its_shape(self):
+        response = self.client.get(reverse('student:get_attendance_by_date'), {'date': '2025-07-02'})
+        self.assertEqual(len(response.json()), 3)
+        response = self.client.get(reverse('student:get_attendance_by_date'), {'date': '2025-07-09'})
+        self.assertEqual(response.json(), [])
+
+
+class MarkAttendanceTests(StudentTestCase):
+    def scan(self, view_name, qr_code_data):
+        return self.client.post(reverse(view_name), {'qr_code_data': qr_code_data}, content_type='application/json').json()
+
+    def test_sync_and_async_scans_validate_alike(self):
+        lecture = self.lectures[0][0]
+        token, _ = tokens.issue_token(lecture)
+        for view_name in ('student:mark_attendance', 'student:mark_attendance_async'):
+            with self.subTest(view_name=view_name):
+                self.assertEqual(self.scan(view_name, 'not-a-token')['message'], 'Invalid QR code.')
+                Attendance.objects.filter(lecture=lecture).delete()
+                self.assertIn('has been recorded', self.scan(view_name, token)['message'])
+                self.assertIn('already scanned', self.scan(view_name, token)['message'])
+
+        self.classes[0].students.remove(self.student)
+        result = self.scan('student:mark_attendance_async', token)
+        self.assertEqual(result, {'success': False, 'message': 'You are not enrolled in FY.'})
+
+
+class ScanRateLimitTests(StudentTestCase):
+    def scan(self):
+        return self.client.post(reverse('student:mark_attendance'), {'qr_code_data': 'not-a-token'}, content_type='application/json')
+
+    def test_user_bucket_returns_429_with_retry_after(self):
+        for _ in range(10):  # RATE_LIMITS allows 10 scans a minute per user
+            self.assertEqual(self.scan().status_code, 200)
+        response = self.scan()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_new_session_cookies_do_not_reset_the_bucket(self):
+        self.client.logout()
+        for attempt in range(11):
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = f'forged-session-{attempt}'
+            response = self.scan()
+        self.assertEqual(response.status_code, 429)
+
+
+    def test_failed_client_key_releases_the_slot(self):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        with mock.patch.object(middleware, 'client_key', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                middleware(RequestFactory().post(reverse('student:mark_attendance')))
+        self.assertEqual(middleware._in_flight, {'student:mark_attendance': 0})
+
+    async def test_failed_client_key_releases_the_slot_async(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = RateLimitMiddleware(get_response)
+        with mock.patch.object(middleware, 'client_key', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await middleware(RequestFactory().post(reverse('student:mark_attendance')))
+        self.assertEqual(middleware._in_flight, {'student:mark_attendance': 0})
+
+class ScanIngestionTests(StudentTestCase):
+    def setUp(self):
+        super().setUp()
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_path = os.path.join(spool_dir.name, 'spool.jsonl')
+        self.ingestor = ingestion.ScanIngestor(
+            queue_size=2, flush_size=10, flush_interval=0.01, enqueue_timeout=0.01,
+            max_retries=2, retry_backoff=0, spool_path=self.spool_path,
+        )
+        self.scans = [
+            ingestion.Scan(self.student.id, self.student.name, lecture.id, lecture.subject_id, lecture.date)
+            for lecture in self.lectures[0]
+        ]
+
+    def recorded(self):
+        return sorted(Attendance.objects.values_list('lecture_id', flat=True))
+
+    def test_full_queue_rejects_scans(self):
+        with mock.patch.object(self.ingestor, 'start'):
+            self.assertEqual([self.ingestor.submit(scan) for scan in self.scans[:3]], [True, True, False])
+
+    def test_stop_flushes_queued_scans(self):
+        with mock.patch.object(ingestion, 'write_scans', return_value=[]) as write_scans:
+            self.assertTrue(self.ingestor.submit(self.scans[0]))
+            self.ingestor.stop(timeout=5)
+        written = [scan for call in write_scans.call_args_list for scan in call.args[0]]
+        self.assertEqual(written, self.scans[:1])
+
+    def test_failed_write_is_retried(self):
+        write_scans = mock.Mock(side_effect=[OperationalError('database is locked'), []])
+        with mock.patch.object(ingestion, 'write_scans', write_scans), self.assertLogs(ingestion.logger, 'ERROR'):
+            self.ingestor._flush(self.scans)
+        self.assertEqual(write_scans.call_count, 2)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_unwritable_batch_is_spooled_and_requeued(self):
+        failing = mock.Mock(side_effect=OperationalError('database is locked'))
+        with mock.patch.object(ingestion, 'write_scans', failing), self.assertLogs(ingestion.logger, 'ERROR'):
+            self.ingestor._flush(self.scans)
+        self.assertEqual(failing.call_count, 3)
+        self.assertEqual(self.recorded(), [])
+
+        with mock.patch.object(ingestion, 'broadcast_scans'):
+            self.ingestor._requeue_spooled()
+        self.assertEqual(self.recorded(), sorted(lecture.id for lecture in self.lectures[0]))
+        self.assertEqual(os.listdir(os.path.dirname(self.spool_path)), [])
@@ -11,9 +11,12 @@ urlpatterns = [
     path('dashboard/', views.student_dashboard, name='student_dashboard'),
     path('register/', views.student_register_view, name='register'),
     path('mark-attendance/', views.mark_attendance, name='mark_attendance'),
+    path('mark-attendance/async/', views.mark_attendance_async, name='mark_attendance_async'),
     path('scan-qr/', views.scan_qr_code, name='scan_qr_code'),
     path('profile/', views.profile, name='profile'),
+    path('attendance-calendar/', views.get_attendance_calendar_data, name='get_attendance_calendar_data'),
     path('attendance-by-date/', views.get_attendance_by_date, name='get_attendance_by_date'),
+    path('attendance-by-date-range/', views.get_attendance_by_date_range, name='get_attendance_by_date_range'),
     path('unenroll/<int:class_id>/', views.unenroll, name='unenroll'),
     path('enroll/<int:class_id>/', views.enroll, name='enroll'),
     path('reports/', views.reports, name='reports'),
@@ -2,22 +2,48 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from .models import CustomUser
-from teacher.models import Class, Attendance, QRCode, Lecture, AcademicSession, Subject
-from django.http import JsonResponse, HttpResponseForbidden
+from teacher.models import Class, Attendance, Lecture, AcademicSession, Subject
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponseNotAllowed
 from django.core.exceptions import PermissionDenied
 from django.views.decorators.http import require_POST
 import json
+import logging
 import random
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import authenticate, login, get_user
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.hashers import make_password
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from datetime import datetime
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from asgiref.sync import sync_to_async
+from teacher import enrollment, notifications, reports as report_cache, summary, tokens
+from . import attendance_calendar, dashboard, ingestion
+
+logger = logging.getLogger(__name__)
+
+# Longest start/end range get_attendance_calendar_data answers, in months
+MAX_CALENDAR_MONTHS = 24
+
 
 @login_required
 def get_attendance_calendar_data(request):
+    """
+    Calendar events for the student's lectures in the active session. Takes
+    month=YYYY-MM, answered with {'month': ..., 'events': [...]}, or
+    FullCalendar's start and end, answered with the events in between.
+    """
+    month_str = request.GET.get('month')
+    if month_str:
+        try:
+            month = datetime.strptime(month_str, '%Y-%m').date()
+        except ValueError:
+            return JsonResponse({'error': 'Invalid month format.'}, status=400)
+        lectures = attendance_calendar.get_months(request.user, [month])[month]
+        return JsonResponse({
+            'month': f'{month:%Y-%m}',
+            'events': [attendance_calendar.event(*lecture) for lecture in lectures],
+        })
+
     start_date_str = request.GET.get('start')
     end_date_str = request.GET.get('end')
 
@@ -25,104 +51,141 @@ def get_attendance_calendar_data(request):
         return JsonResponse({'error': 'Start and end dates are required.'}, status=400)
 
     try:
-        start_date = datetime.fromisoformat(start_date_str.split('T')[0])
-        end_date = datetime.fromisoformat(end_date_str.split('T')[0])
+        start_date = datetime.fromisoformat(start_date_str.split('T')[0]).date()
+        end_date = datetime.fromisoformat(end_date_str.split('T')[0]).date()
     except ValueError:
         return JsonResponse({'error': 'Invalid date format.'}, status=400)
 
-    try:
-        active_session = AcademicSession.objects.get(is_active=True)
-    except AcademicSession.DoesNotExist:
-        return JsonResponse({'error': 'No active session'}, status=400)
+    months = list(attendance_calendar.months_between(start_date, end_date))
+    if len(months) > MAX_CALENDAR_MONTHS:
+        return JsonResponse({'error': f'At most {MAX_CALENDAR_MONTHS} months can be requested at once.'}, status=400)
+
+    start, end = start_date.isoformat(), end_date.isoformat()
+    buckets = attendance_calendar.get_months(request.user, months)
+    events = [
+        attendance_calendar.event(lecture_date, present)
+        for month in months
+        for lecture_date, present in buckets[month]
+        if start <= lecture_date <= end
+    ]
+    return JsonResponse(events, safe=False)
 
-    student = request.user
-    enrolled_classes = student.enrolled_classes.filter(session=active_session)
-    lectures = Lecture.objects.filter(
-        subject__class_obj__in=enrolled_classes,
-        date__range=[start_date, end_date]
-    )
+def _scan_error(token, student):
+    """Returns the response rejecting a scan of token by student, or None if it can be recorded."""
+    if token is None:
+        return JsonResponse({'success': False, 'message': 'Invalid QR code.'})
 
-    attended_lectures = Attendance.objects.filter(
-        student=student,
-        lecture__in=lectures,
-        status='approved'
-    ).values_list('lecture_id', flat=True)
+    if timezone.now() > token.expires_at:
+        return JsonResponse({'success': False, 'message': 'QR code has expired.'})
 
-    events = []
-    for lecture in lectures:
-        is_present = lecture.id in attended_lectures
-        events.append({
-            'title': 'Present' if is_present else 'Absent',
-            'start': lecture.date.isoformat(),
-            'allDay': True,
-            'color': '#28a745' if is_present else '#dc3545'
-        })
+    if student.role != 'Student':
+        return JsonResponse({'success': False, 'message': 'Only students can mark attendance.'})
+    return None
 
-    return JsonResponse(events, safe=False)
+def _not_enrolled(token):
+    return JsonResponse({'success': False, 'message': f'You are not enrolled in {token.class_name}.'})
+
+def _queued_scan(student, token):
+    return ingestion.Scan(student.id, student.name, token.lecture_id, token.subject_id, token.lecture_date)
+
+def _queued_response(accepted, token):
+    if not accepted:
+        response = JsonResponse({'success': False, 'message': 'The server is busy. Please scan the code again.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+    return JsonResponse({'success': True, 'message': f'Your attendance for {token.subject_name} has been recorded and is pending approval.'})
+
+def _recorded_response(created, token):
+    if created:
+        message = f'Your attendance for {token.subject_name} has been recorded and is pending approval.'
+    else:
+        message = f'You have already scanned the code for {token.subject_name}. Your attendance is pending approval.'
+    return JsonResponse({'success': True, 'message': message})
+
+def _pending_update(student, attendance_id):
+    return {
+        "student_name": student.name,
+        "attendance_id": attendance_id,
+        "status": "pending"
+    }
 
 @login_required
 @require_POST
 def mark_attendance(request):
     try:
-        data = json.loads(request.body)
-        qr_code_data = data.get('qr_code_data')
-
+        qr_code_data = json.loads(request.body).get('qr_code_data')
         if not qr_code_data:
             return JsonResponse({'success': False, 'message': 'QR code data not provided.'})
 
-        try:
-            qr_code = QRCode.objects.select_related('lecture__subject__class_obj').get(qr_code_data=qr_code_data)
-        except QRCode.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Invalid QR code.'})
-
-        if timezone.now() > qr_code.expires_at:
-            return JsonResponse({'success': False, 'message': 'QR code has expired.'})
-
         student = request.user
-        if student.role != 'Student':
-            return JsonResponse({'success': False, 'message': 'Only students can mark attendance.'})
+        token = tokens.resolve_token(qr_code_data)
+        error = _scan_error(token, student)
+        if error is not None:
+            return error
 
-        lecture = qr_code.lecture
-        if not lecture:
-            return JsonResponse({'success': False, 'message': 'This QR code is not linked to a lecture.'})
+        if not enrollment.is_enrolled(token.class_id, student.id):
+            return _not_enrolled(token)
 
-        subject = lecture.subject
-        class_obj = subject.class_obj
-        
-        if not student.enrolled_classes.filter(pk=class_obj.pk).exists():
-            return JsonResponse({'success': False, 'message': f'You are not enrolled in {class_obj.name}.'})
+        if ingestion.is_batched():
+            return _queued_response(ingestion.submit(_queued_scan(student, token)), token)
 
-        attendance, created = Attendance.objects.get_or_create(
-            student=student,
-            lecture=lecture,
-            defaults={'subject': subject, 'date': lecture.date, 'status': 'pending'}
+        attendance_id, created = Attendance.objects.record_scan(
+            student.id, token.lecture_id, token.subject_id, token.lecture_date
         )
-
         if created:
             # Send real-time notification to the teacher's live attendance page
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"attendance_{lecture.id}",
-                {
-                    "type": "attendance_update",
-                    "data": {
-                        "student_name": student.name,
-                        "attendance_id": attendance.id,
-                        "status": "pending"
-                    }
-                }
-            )
-            message = f'Your attendance for {subject.name} has been recorded and is pending approval.'
-        else:
-            message = f'You have already scanned the code for {subject.name}. Your attendance is pending approval.'
+            notifications.send_lecture_updates(token.lecture_id, [_pending_update(student, attendance_id)])
+        return _recorded_response(created, token)
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON data.'})
+    except Exception:
+        logger.exception('Error in mark_attendance')
+        return JsonResponse({'success': False, 'message': 'An unexpected error occurred.'})
+
+async def mark_attendance_async(request):
+    """
+    Native async version of mark_attendance for ASGI deployments. It uses the
+    async ORM and awaits the notification directly instead of bridging
+    through async_to_sync on every scan.
+    """
+    # login_required and require_POST only wrap sync views in this Django version
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    student = await sync_to_async(get_user)(request)
+    if not student.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    try:
+        qr_code_data = json.loads(request.body).get('qr_code_data')
+        if not qr_code_data:
+            return JsonResponse({'success': False, 'message': 'QR code data not provided.'})
+
+        token = await tokens.aresolve_token(qr_code_data)
+        error = _scan_error(token, student)
+        if error is not None:
+            return error
+
+        if not await enrollment.ais_enrolled(token.class_id, student.id):
+            return _not_enrolled(token)
+
+        if ingestion.is_batched():
+            submit = sync_to_async(ingestion.submit, thread_sensitive=False)
+            return _queued_response(await submit(_queued_scan(student, token)), token)
 
-        return JsonResponse({'success': True, 'message': message})
+        attendance_id, created = await Attendance.objects.arecord_scan(
+            student.id, token.lecture_id, token.subject_id, token.lecture_date
+        )
+        if created:
+            # Send real-time notification to the teacher's live attendance page
+            await notifications.asend_lecture_updates(token.lecture_id, [_pending_update(student, attendance_id)])
+        return _recorded_response(created, token)
 
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'message': 'Invalid JSON data.'})
-    except Exception as e:
-        # Log the error for debugging
-        print(f"Error in mark_attendance: {e}")
+    except Exception:
+        logger.exception('Error in mark_attendance_async')
         return JsonResponse({'success': False, 'message': 'An unexpected error occurred.'})
 
 @ensure_csrf_cookie
@@ -160,27 +223,16 @@ def student_dashboard(request):
     if request.user.role != 'Student':
         raise PermissionDenied
     
-    try:
-        active_session = AcademicSession.objects.get(is_active=True)
-    except AcademicSession.DoesNotExist:
+    enrollments = dashboard.get(request.user)
+    if enrollments is None:
         messages.error(request, "There is no active academic session. Please contact an administrator.")
         return render(request, 'student/student_dashboard.html', {'enrollments': []})
 
-    enrolled_classes = request.user.enrolled_classes.filter(session=active_session)
-    enrollments = []
-    if enrolled_classes.exists():
-        for class_obj in enrolled_classes:
-            total_lectures = Lecture.objects.filter(subject__class_obj=class_obj).count()
-            attended_lectures = Attendance.objects.filter(lecture__subject__class_obj=class_obj, student=request.user, status='approved').count()
-            attendance_percentage = (attended_lectures / total_lectures) * 100 if total_lectures > 0 else 0
-            enrollments.append({
-                'class_obj': class_obj,
-                'attendance_percentage': round(attendance_percentage)
-            })
+    if enrollments:
         return render(request, 'student/student_dashboard.html', {'enrollments': enrollments})
     else:
         # Show classes from the active session for enrollment
-        classes = Class.objects.filter(session=active_session)
+        classes = Class.objects.filter(session__is_active=True)
         return render(request, 'student/student_dashboard.html', {'classes': classes})
 
 @login_required
@@ -251,38 +303,75 @@ def student_register_view(request):
     }
     return render(request, 'student/register.html', context)
 
-@login_required
-def get_attendance_by_date(request):
-    date_str = request.GET.get('date')
-    if not date_str:
-        return JsonResponse({'error': 'Date not provided.'}, status=400)
+# Longest range get_attendance_by_date_range answers, in days
+MAX_ATTENDANCE_RANGE_DAYS = 366
 
-    try:
-        date = datetime.fromisoformat(date_str).date()
-    except ValueError:
-        return JsonResponse({'error': 'Invalid date format.'}, status=400)
 
-    student = request.user
-    enrolled_classes = student.enrolled_classes.all()
-    lectures = Lecture.objects.filter(
-        subject__class_obj__in=enrolled_classes,
-        date=date
+def _attendance_by_day(student, start_date, end_date):
+    """
+    {ISO date: [{'subject', 'status'}]} for the days from start_date to
+    end_date that had lectures in any of the student's classes. Two queries
+    however long the range is.
+    """
+    in_range = Lecture.objects.filter(
+        subject__class_obj__students=student,
+        date__range=[start_date, end_date]
     )
+    lectures = list(in_range.select_related('subject').only('date', 'subject__name').order_by('date', 'time'))
 
-    attended_lectures = Attendance.objects.filter(
+    # A subquery rather than a list of ids, which would bind one SQL
+    # parameter per lecture
+    attended_lecture_ids = set(Attendance.objects.filter(
         student=student,
-        lecture__in=lectures,
+        lecture__in=in_range.values('pk'),
         status='approved'
-    ).values_list('lecture_id', flat=True)
+    ).values_list('lecture_id', flat=True))
 
-    data = []
+    days = {}
     for lecture in lectures:
-        is_present = lecture.id in attended_lectures
-        data.append({
+        days.setdefault(lecture.date.isoformat(), []).append({
             'subject': lecture.subject.name,
-            'status': 'Present' if is_present else 'Absent'
+            'status': 'Present' if lecture.id in attended_lecture_ids else 'Absent'
         })
+    return days
+
+
+@login_required
+def get_attendance_by_date_range(request):
+    start_date_str = request.GET.get('start')
+    end_date_str = request.GET.get('end')
+    if not start_date_str or not end_date_str:
+        return JsonResponse({'error': 'Start and end dates are required.'}, status=400)
 
+    try:
+        start_date = datetime.fromisoformat(start_date_str).date()
+        end_date = datetime.fromisoformat(end_date_str).date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format.'}, status=400)
+    if end_date < start_date:
+        return JsonResponse({'error': 'The end date is before the start date.'}, status=400)
+    if (end_date - start_date).days >= MAX_ATTENDANCE_RANGE_DAYS:
+        return JsonResponse({'error': f'At most {MAX_ATTENDANCE_RANGE_DAYS} days can be requested at once.'}, status=400)
+
+    return JsonResponse({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'days': _attendance_by_day(request.user, start_date, end_date),
+    })
+
+
+@login_required
+def get_attendance_by_date(request):
+    date_str = request.GET.get('date')
+    if not date_str:
+        return JsonResponse({'error': 'Date not provided.'}, status=400)
+
+    try:
+        date = datetime.fromisoformat(date_str).date()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format.'}, status=400)
+
+    data = _attendance_by_day(request.user, date, date).get(date.isoformat(), [])
     return JsonResponse(data, safe=False)
 
 @login_required
@@ -294,7 +383,7 @@ def unenroll(request, class_id):
         messages.error(request, 'This class is not available in the current academic session.')
         return redirect('student:student_dashboard')
 
-    if request.user in class_obj.students.all():
+    if enrollment.is_enrolled(class_obj.id, request.user.id, confirm=True):
         class_obj.students.remove(request.user)
         messages.success(request, f'You have been unenrolled from {class_obj.name}.')
     else:
@@ -310,7 +399,7 @@ def enroll(request, class_id):
         messages.error(request, 'This class is not available in the current academic session.')
         return redirect('student:student_dashboard')
 
-    if request.user not in class_obj.students.all():
+    if not enrollment.is_enrolled(class_obj.id, request.user.id, confirm=True):
         class_obj.students.add(request.user)
         messages.success(request, f'You have been enrolled in {class_obj.name}.')
     else:
@@ -343,26 +432,23 @@ def get_student_subject_attendance_data(request):
     try:
         subject = Subject.objects.get(pk=subject_id)
         # Permission check: Ensure the student is enrolled in the subject's class
-        if not request.user.enrolled_classes.filter(pk=subject.class_obj.pk).exists():
+        if not request.user.enrolled_classes.filter(pk=subject.class_obj_id).exists():
             return JsonResponse({'error': 'Permission denied.'}, status=403)
     except Subject.DoesNotExist:
         return JsonResponse({'error': 'Subject not found.'}, status=404)
 
-    total_lectures = Lecture.objects.filter(subject=subject).count()
-    
-    if total_lectures == 0:
-        return JsonResponse({'attended': 0, 'missed': 0})
+    def build():
+        total_lectures = summary.lecture_count(subject.id)
+        if total_lectures == 0:
+            return {'attended': 0, 'missed': 0}
 
-    attended_lectures = Attendance.objects.filter(
-        student=request.user,
-        lecture__subject=subject,
-        status='approved'
-    ).count()
+        attended_lectures = summary.approved_count(subject.id, request.user.id)
+        return {
+            'attended': attended_lectures,
+            'missed': total_lectures - attended_lectures
+        }
 
-    return JsonResponse({
-        'attended': attended_lectures,
-        'missed': total_lectures - attended_lectures
-    })
+    return report_cache.cached_report_response(request, 'student_subject_attendance', subject.id, build, user_id=request.user.id)
 
 @login_required
 def get_student_attendance_trend(request):
@@ -372,22 +458,24 @@ def get_student_attendance_trend(request):
 
     try:
         subject = Subject.objects.get(pk=subject_id)
-        if not request.user.enrolled_classes.filter(pk=subject.class_obj.pk).exists():
+        if not request.user.enrolled_classes.filter(pk=subject.class_obj_id).exists():
             return JsonResponse({'error': 'Permission denied.'}, status=403)
     except Subject.DoesNotExist:
         return JsonResponse({'error': 'Subject not found.'}, status=404)
 
-    lectures = Lecture.objects.filter(subject=subject).order_by('date')
-    if not lectures.exists():
-        return JsonResponse({'labels': [], 'data': []})
+    def build():
+        lectures = list(Lecture.objects.filter(subject=subject).order_by('date'))
+        if not lectures:
+            return {'labels': [], 'data': []}
 
-    attended_lecture_ids = set(Attendance.objects.filter(
-        student=request.user,
-        lecture__in=lectures,
-        status='approved'
-    ).values_list('lecture_id', flat=True))
+        attended_lecture_ids = set(Attendance.objects.filter(
+            student=request.user,
+            lecture__in=lectures,
+            status='approved'
+        ).values_list('lecture_id', flat=True))
 
-    labels = [lecture.date.strftime('%Y-%m-%d') for lecture in lectures]
-    data = [1 if lecture.id in attended_lecture_ids else 0 for lecture in lectures]
+        labels = [lecture.date.strftime('%Y-%m-%d') for lecture in lectures]
+        data = [1 if lecture.id in attended_lecture_ids else 0 for lecture in lectures]
+        return {'labels': labels, 'data': data}
 
-    return JsonResponse({'labels': labels, 'data': data})
+    return report_cache.cached_report_response(request, 'student_attendance_trend', subject.id, build, user_id=request.user.id)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django import forms
-from .models import Course, Class, Attendance, QRCode, Subject, AcademicSession
+from .models import Course, Class, Attendance, Defaulter, QRCode, Subject, AcademicSession
 
 class CourseForm(forms.ModelForm):
     class Meta:
@@ -74,4 +74,18 @@ class HistoricalAttendanceAdmin(admin.ModelAdmin):
         return False
 
 admin.site.register(HistoricalAttendance, HistoricalAttendanceAdmin)
-admin.site.register(QRCode)
\ No newline at end of file
+admin.site.register(QRCode)
+
+
+class DefaulterAdmin(admin.ModelAdmin):
+    list_display = ('student', 'subject', 'attended', 'total_lectures', 'percentage', 'computed_at')
+    list_filter = ('subject__class_obj__session', 'subject')
+    search_fields = ('student__name', 'student__email', 'subject__name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(Defaulter, DefaulterAdmin)
@@ -0,0 +1,169 @@
+"""
+Vectorized attendance analytics over a student × lecture matrix.
+
+load_matrix() reads a class's roster, its lectures (optionally only those of
+some subjects) and their approved attendance in three queries, and packs
+them into a NumPy boolean matrix with one row per student and one column per
+lecture. analyse() derives everything the reports page shows from that
+matrix with array operations, so a 1,000 × 300 class takes around ten
+milliseconds once loaded. Loading is bound by fetching the attendance rows,
+which is why the endpoint caches its result (see
+teacher.reports.cached_report_response).
+"""
+
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.db import connection
+from django.db.models import Q
+
+from .models import Attendance, Lecture
+
+
+class AttendanceMatrix:
+    """
+    present[i, j] is True when student_ids[i] has approved attendance for
+    lecture_ids[j]. Students are in id order, lectures in date order.
+    """
+
+    def __init__(self, student_ids, student_names, lecture_ids, lecture_dates, present):
+        self.student_ids = student_ids
+        self.student_names = student_names
+        self.lecture_ids = lecture_ids
+        self.lecture_dates = lecture_dates
+        self.present = present
+
+
+def _index(ids, values):
+    """Positions of values in the sorted array ids, and which were found."""
+    positions = np.searchsorted(ids, values)
+    found = positions < len(ids)
+    found[found] = ids[positions[found]] == values[found]
+    return positions, found
+
+
+def load_matrix(class_obj, subjects=None):
+    roster = list(class_obj.students.order_by('id').values_list('id', 'name'))
+    student_ids = np.fromiter((student_id for student_id, _ in roster), dtype=np.int64, count=len(roster))
+
+    lecture_filter = Q(subject__class_obj=class_obj)
+    if subjects is not None:
+        lecture_filter &= Q(subject__in=subjects)
+    lectures = list(Lecture.objects.filter(lecture_filter).order_by('date', 'time', 'id').values_list('id', 'date'))
+    lecture_ids = np.fromiter((lecture_id for lecture_id, _ in lectures), dtype=np.int64, count=len(lectures))
+
+    records = Attendance.objects.filter(
+        lecture__in=Lecture.objects.filter(lecture_filter), status='approved'
+    ).values_list('student_id', 'lecture_id')
+    # A class has hundreds of thousands of these, so they are read straight
+    # into an array rather than through the ORM's per-row handling
+    with connection.cursor() as cursor:
+        cursor.execute(*records.query.sql_with_params())
+        fetched = cursor.fetchall()
+    pairs = np.fromiter(chain.from_iterable(fetched), dtype=np.int64, count=2 * len(fetched)).reshape(-1, 2)
+
+    present = np.zeros((len(student_ids), len(lecture_ids)), dtype=bool)
+    rows, student_found = _index(student_ids, pairs[:, 0])
+    lecture_order = np.argsort(lecture_ids, kind='stable')
+    columns, lecture_found = _index(lecture_ids[lecture_order], pairs[:, 1])
+    # Records of students who have since left the class are dropped
+    keep = student_found & lecture_found
+    present[rows[keep], lecture_order[columns[keep]]] = True
+
+    return AttendanceMatrix(
+        student_ids=student_ids,
+        student_names=[name for _, name in roster],
+        lecture_ids=lecture_ids,
+        lecture_dates=[lecture_date for _, lecture_date in lectures],
+        present=present,
+    )
+
+
+def longest_absence_streaks(present):
+    """The longest run of consecutive missed lectures in each row."""
+    students, lectures = present.shape
+    if lectures == 0:
+        return np.zeros(students, dtype=np.int64)
+    absent = np.zeros((students, lectures + 2), dtype=np.int8)
+    absent[:, 1:-1] = ~present
+    edges = np.diff(absent, axis=1)
+    # Runs start at +1 and end at -1 edges; both come out in row-major order
+    starts = np.argwhere(edges == 1)
+    ends = np.argwhere(edges == -1)
+    streaks = np.zeros(students, dtype=np.int64)
+    np.maximum.at(streaks, starts[:, 0], ends[:, 1] - starts[:, 1])
+    return streaks
+
+
+def weekly_rates(present, lecture_dates):
+    """
+    Returns (week_starts, class_rates, student_rates): the Monday of each week
+    that had lectures, the class's attendance rate in each of those weeks,
+    and each student's (a students × weeks array).
+    """
+    week_starts = [lecture_date - timedelta(days=lecture_date.weekday()) for lecture_date in lecture_dates]
+    weeks, week_index = np.unique(np.array(week_starts, dtype='datetime64[D]'), return_inverse=True)
+    in_week = np.zeros((len(lecture_dates), len(weeks)), dtype=np.float32)
+    in_week[np.arange(len(lecture_dates)), week_index] = 1
+    lectures_per_week = in_week.sum(axis=0)
+
+    attended = present.astype(np.float32) @ in_week
+    student_rates = attended / lectures_per_week
+    students = max(present.shape[0], 1)
+    class_rates = attended.sum(axis=0) / (lectures_per_week * students)
+    return weeks.astype(object), class_rates, student_rates
+
+
+def analyse(matrix):
+    """
+    Summarises a matrix for the reports page. Percentages are 0-100;
+    trends compare the last two weeks that had lectures, in percentage
+    points.
+    """
+    present = matrix.present
+    students, lectures = present.shape
+    if lectures == 0:
+        percentages = np.zeros(students)
+        turnout = np.zeros(0)
+    else:
+        percentages = present.mean(axis=1) * 100
+        turnout = present.mean(axis=0) * 100 if students else np.zeros(lectures)
+
+    streaks = longest_absence_streaks(present)
+    weeks, class_rates, student_rates = weekly_rates(present, matrix.lecture_dates)
+    if len(weeks) >= 2:
+        trends = (student_rates[:, -1] - student_rates[:, -2]) * 100
+    else:
+        trends = np.zeros(students)
+    changes = np.diff(class_rates, prepend=np.nan) * 100
+
+    return {
+        'total_students': students,
+        'total_lectures': lectures,
+        'average_attendance': round(float(percentages.mean()), 1) if students else 0,
+        'students': [
+            {
+                'id': int(student_id),
+                'name': name,
+                'percentage': round(float(percentage), 1),
+                'longest_absence_streak': int(streak),
+                'trend': round(float(trend), 1),
+            }
+            for student_id, name, percentage, streak, trend in zip(
+                matrix.student_ids, matrix.student_names, percentages, streaks, trends
+            )
+        ],
+        'lectures': [
+            {'id': int(lecture_id), 'date': lecture_date.isoformat(), 'turnout': round(float(rate), 1)}
+            for lecture_id, lecture_date, rate in zip(matrix.lecture_ids, matrix.lecture_dates, turnout)
+        ],
+        'weeks': [
+            {
+                'start': week.isoformat(),
+                'attendance': round(float(rate) * 100, 1),
+                'change': None if np.isnan(change) else round(float(change), 1),
+            }
+            for week, rate, change in zip(weeks, class_rates, changes)
+        ],
+    }
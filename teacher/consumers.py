@@ -1,10 +1,39 @@
+import asyncio
 import json
+import logging
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from . import rotation
+from .models import Lecture
+
+logger = logging.getLogger(__name__)
 
 class AttendanceConsumer(AsyncWebsocketConsumer):
+    """
+    Streams a lecture's attendance changes to its teacher's live page.
+
+    Changes are buffered for ATTENDANCE_WS_BATCH_WINDOW_MS after the first
+    one arrives and sent as a single {"updates": [...]} frame, so a scan
+    storm costs a few frames per second instead of one per scan.
+    """
+
+    # Send early if this many updates pile up within one window
+    max_batch_size = 500
+
     async def connect(self):
         self.lecture_id = self.scope['url_route']['kwargs']['lecture_id']
         self.lecture_group_name = f'attendance_{self.lecture_id}'
+        self.pending_updates = []
+        self.flush_task = None
+        self.batch_window = getattr(settings, 'ATTENDANCE_WS_BATCH_WINDOW_MS', 150) / 1000
+        self.log_frames = getattr(settings, 'ATTENDANCE_WS_LOGGING', False)
+
+        # Only the teacher of the lecture may follow its attendance feed
+        self.lecture = await self.get_followed_lecture()
+        if self.lecture is None:
+            await self.close()
+            return
 
         # Join room group
         await self.channel_layer.group_add(
@@ -14,7 +43,26 @@ class AttendanceConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Keep the page's QR code rotating, and bring a reconnecting page
+        # up to date with any rotation it missed
+        current = await rotation.scheduler.watch(self.lecture)
+        if current is not None:
+            await self.send(text_data=json.dumps({'qr': current}))
+
+    @database_sync_to_async
+    def get_followed_lecture(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or user.role != 'Teacher':
+            return None
+        return Lecture.objects.select_related('subject__class_obj').filter(
+            pk=self.lecture_id, subject__teacher=user
+        ).first()
+
     async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        if getattr(self, 'lecture', None) is not None:
+            rotation.scheduler.unwatch(self.lecture.id)
         # Leave room group
         await self.channel_layer.group_discard(
             self.lecture_group_name,
@@ -25,10 +73,40 @@ class AttendanceConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         pass
 
-    # Receive message from room group
+    # Receive a single change from the room group
     async def attendance_update(self, event):
-        print(f"Received attendance_update event: {event}")
-        # Send message to WebSocket
-        data = json.dumps(event['data'])
-        print(f"Sending data to WebSocket: {data}")
-        await self.send(text_data=data)
+        await self.queue_updates([event['data']])
+
+    # Receive a coalesced batch of changes from the room group
+    async def attendance_batch(self, event):
+        await self.queue_updates(event['data'])
+
+    # Receive a newly rotated QR token; sent at once, not batched
+    async def qr_rotate(self, event):
+        await self.send(text_data=json.dumps({'qr': event['data']}))
+
+    async def queue_updates(self, updates):
+        self.pending_updates.extend(updates)
+        if self.batch_window <= 0 or len(self.pending_updates) >= self.max_batch_size:
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+                self.flush_task = None
+            await self.flush_updates()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_after_window())
+
+    async def flush_after_window(self):
+        await asyncio.sleep(self.batch_window)
+        self.flush_task = None
+        await self.flush_updates()
+
+    async def flush_updates(self):
+        updates, self.pending_updates = self.pending_updates, []
+        if not updates:
+            return
+        if self.log_frames:
+            logger.info(
+                'attendance frame sent',
+                extra={'lecture_id': self.lecture_id, 'updates': len(updates), 'channel': self.channel_name}
+            )
+        await self.send(text_data=json.dumps({'updates': updates}))
@@ -0,0 +1,85 @@
+"""
+Detection of students below the attendance threshold.
+
+find() checks every enrolled student of many subjects in one grouped query
+over the summary tables (see teacher.summary): each subject's lecture count
+against each roster member's approved count. refresh() stores the result in
+the Defaulter table, which dashboards and the get_defaulters endpoint read.
+
+The find_defaulters command runs refresh() for the active session. In
+incremental mode it only rechecks subjects whose summary version moved since
+their rows were computed, or that were checked with another threshold.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import Defaulter, StudentSubjectSummary, Subject, SubjectSummary
+
+
+def default_threshold():
+    return getattr(settings, 'DEFAULTER_THRESHOLD', 75)
+
+
+def find(subject_ids, threshold):
+    """
+    Yields (subject_id, student_id, attended, total_lectures) for each
+    student whose approved attendance is below threshold percent of a
+    subject's lectures. Subjects without lectures have no defaulters.
+    """
+    attended = StudentSubjectSummary.objects.filter(
+        subject=OuterRef('pk'), student=OuterRef('class_obj__students')
+    ).values('approved_count')
+    return Subject.objects.filter(
+        pk__in=subject_ids, class_obj__students__isnull=False, summary__lecture_count__gt=0
+    ).annotate(
+        attended=Coalesce(Subquery(attended, output_field=IntegerField()), 0),
+    ).filter(
+        # attended / lectures < threshold%, without dividing
+        attended__lt=Cast(F('summary__lecture_count'), FloatField()) * threshold / 100
+    ).values_list('pk', 'class_obj__students', 'attended', 'summary__lecture_count')
+
+
+def refresh(threshold=None, incremental=False):
+    """
+    Recomputes the Defaulter rows of the active session's subjects, or of
+    those that changed when incremental. Rows of subjects outside the
+    active session are dropped. Returns the number of subjects checked and
+    of defaulters found among them.
+    """
+    threshold = default_threshold() if threshold is None else threshold
+    subjects = SubjectSummary.objects.filter(subject__class_obj__session__is_active=True)
+    if incremental:
+        subjects = subjects.filter(
+            Q(defaulters_version__isnull=True) | ~Q(defaulters_version=F('version')) | ~Q(defaulters_threshold=threshold)
+        )
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Versions are read first: a change made while this runs leaves the
+        # subject to be rechecked next time
+        versions = dict(subjects.values_list('subject_id', 'version'))
+        rows = [
+            Defaulter(
+                subject_id=subject_id, student_id=student_id, attended=attended, total_lectures=total_lectures,
+                percentage=attended / total_lectures * 100, threshold=threshold, computed_at=now,
+            )
+            for subject_id, student_id, attended, total_lectures in find(list(versions), threshold)
+        ]
+
+        if incremental:
+            Defaulter.objects.filter(
+                Q(subject__in=versions) | ~Q(subject__class_obj__session__is_active=True)
+            ).delete()
+        else:
+            Defaulter.objects.all().delete()
+        Defaulter.objects.bulk_create(rows, batch_size=1000)
+        if versions:
+            SubjectSummary.objects.filter(subject_id__in=versions).update(
+                defaulters_version=Case(*(When(subject_id=subject_id, then=Value(version)) for subject_id, version in versions.items())),
+                defaulters_threshold=threshold,
+            )
+    return len(versions), len(rows)
@@ -0,0 +1,264 @@
+"""
+Delivery of queued notifications from the OutboxMessage table.
+
+The dispatch_notifications command calls dispatch_batch() in a loop. Each
+batch leases up to BATCH_SIZE due messages, so several workers can run side
+by side. Messages for the same recipient are merged into one delivery, so a
+lecture page gets one attendance_batch event and a student one
+attendance_status_batch event, however many changes were queued. Emails
+share one SMTP connection per batch.
+
+A failed delivery is retried after RETRY_BACKOFF_SECONDS, doubling with each
+attempt, until MAX_ATTEMPTS is reached. A worker that dies mid-batch leaves
+its messages to be picked up again once their LEASE_SECONDS lease runs out.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from . import notifications
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'inline',
+    'BATCH_SIZE': 200,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF_SECONDS': 5,
+    'LEASE_SECONDS': 60,
+    'POLL_INTERVAL_MS': 500,
+    'RETENTION_HOURS': 24,
+}
+
+LECTURE_EVENT_TYPES = ('attendance_update', 'attendance_batch')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'NOTIFICATIONS', {})}
+
+
+def claim(batch_size, lease_seconds, max_attempts):
+    """
+    Leases up to batch_size due messages to this worker and counts the
+    attempt. Candidates are leased with a conditional UPDATE that only
+    matches rows still due, so when two workers read the same candidates
+    only the one whose UPDATE changed a row delivers it.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(
+            delivered_at__isnull=True,
+            available_at__lte=now,
+            attempts__lt=max_attempts,
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        candidates = list(due.values_list('pk', flat=True)[:batch_size])
+        if not candidates:
+            return []
+        claimed = _lease(candidates, now, lease_until, max_attempts)
+    return list(OutboxMessage.objects.filter(pk__in=claimed).order_by('id'))
+
+
+def _lease(candidates, now, lease_until, max_attempts):
+    """Leases the candidates that are still due; returns the ids it leased."""
+    if not _supports_update_returning():
+        # One conditional UPDATE per row; its row count says who won
+        return [
+            pk for pk in candidates
+            if OutboxMessage.objects.filter(
+                pk=pk, delivered_at__isnull=True, available_at__lte=now, attempts__lt=max_attempts
+            ).update(available_at=lease_until, attempts=F('attempts') + 1)
+        ]
+
+    opts = OutboxMessage._meta
+    qn = connection.ops.quote_name
+    available_at, attempts, delivered_at = (
+        qn(opts.get_field(name).column) for name in ('available_at', 'attempts', 'delivered_at')
+    )
+    pk = qn(opts.pk.column)
+    sql = (
+        'UPDATE %s SET %s = %%s, %s = %s + 1 WHERE %s IN (%s) AND %s IS NULL AND %s <= %%s AND %s < %%s RETURNING %s' % (
+            qn(opts.db_table), available_at, attempts, attempts,
+            pk, ', '.join(['%s'] * len(candidates)), delivered_at, available_at, attempts, pk,
+        )
+    )
+    field = opts.get_field('available_at')
+    params = [
+        field.get_db_prep_save(lease_until, connection),
+        *candidates,
+        field.get_db_prep_save(now, connection),
+        max_attempts,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+
+def _supports_update_returning():
+    # Django has no feature flag for UPDATE ... RETURNING. PostgreSQL has it,
+    # and SQLite added it in 3.35 along with INSERT ... RETURNING; MariaDB
+    # and Oracle can return columns from an INSERT but not like this.
+    return connection.vendor in ('sqlite', 'postgresql') and connection.features.can_return_columns_from_insert
+
+
+def coalesce(messages):
+    """
+    Merges group messages into one event per recipient and event type.
+    Returns (group, event, messages) triples.
+    """
+    deliveries = OrderedDict()
+    for message in messages:
+        event = message.payload
+        if event['type'] in LECTURE_EVENT_TYPES:
+            key = (message.recipient, 'lecture')
+        elif event['type'] == 'attendance_status_update':
+            key = (message.recipient, 'status')
+        else:
+            key = (message.recipient, message.pk)
+        deliveries.setdefault(key, []).append(message)
+
+    result = []
+    for (group, kind), batch in deliveries.items():
+        if kind == 'lecture':
+            updates = []
+            for message in batch:
+                data = message.payload['data']
+                updates.extend(data if isinstance(data, list) else [data])
+            event = notifications.lecture_event(updates)
+        elif kind == 'status' and len(batch) > 1:
+            event = {
+                'type': 'attendance_status_batch',
+                'messages': [message.payload['message'] for message in batch],
+            }
+        else:
+            event = batch[0].payload
+        result.append((group, event, batch))
+    return result
+
+
+async def _send_groups(deliveries):
+    channel_layer = get_channel_layer()
+    return await asyncio.gather(
+        *(channel_layer.group_send(group, event) for group, event, _ in deliveries),
+        return_exceptions=True
+    )
+
+
+def deliver_groups(messages):
+    """Returns (delivered, failed) lists; failed holds (message, error) pairs."""
+    deliveries = coalesce(messages)
+    if not deliveries:
+        return [], []
+    delivered, failed = [], []
+    for (_, _, batch), outcome in zip(deliveries, async_to_sync(_send_groups)(deliveries)):
+        if isinstance(outcome, Exception):
+            failed.extend((message, outcome) for message in batch)
+        else:
+            delivered.extend(batch)
+    return delivered, failed
+
+
+def deliver_emails(messages):
+    delivered, failed = [], []
+    if not messages:
+        return delivered, failed
+    with get_connection() as mail_connection:
+        for message in messages:
+            email = EmailMessage(
+                message.payload['subject'],
+                message.payload['body'],
+                message.payload['from_email'],
+                [message.recipient],
+                connection=mail_connection,
+            )
+            try:
+                email.send()
+            except Exception as error:
+                failed.append((message, error))
+            else:
+                delivered.append(message)
+    return delivered, failed
+
+
+def dispatch_batch(config=None):
+    """
+    Delivers one batch of due messages. Returns a dict with the number of
+    messages claimed, delivered and failed, and the delivery latencies (in
+    seconds, from enqueue to delivery) of the delivered ones.
+    """
+    config = config or get_config()
+    messages = claim(config['BATCH_SIZE'], config['LEASE_SECONDS'], config['MAX_ATTEMPTS'])
+    if not messages:
+        return {'claimed': 0, 'delivered': 0, 'failed': 0, 'latencies': []}
+
+    delivered, failed = deliver_groups([message for message in messages if message.kind == 'group'])
+    sent_emails, failed_emails = deliver_emails([message for message in messages if message.kind == 'email'])
+    delivered += sent_emails
+    failed += failed_emails
+
+    now = timezone.now()
+    OutboxMessage.objects.filter(pk__in=[message.pk for message in delivered]).update(delivered_at=now, last_error='')
+    for message, error in failed:
+        logger.warning('Delivery of outbox message %s to %s failed (attempt %s): %s',
+                       message.pk, message.recipient, message.attempts, error)
+        backoff = config['RETRY_BACKOFF_SECONDS'] * 2 ** (message.attempts - 1)
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            available_at=now + timedelta(seconds=backoff),
+            last_error=str(error)[:1000],
+        )
+
+    return {
+        'claimed': len(messages),
+        'delivered': len(delivered),
+        'failed': len(failed),
+        'latencies': [(now - message.created_at).total_seconds() for message in delivered],
+    }
+
+
+def stats(config=None):
+    """
+    Queue metrics: pending (waiting to be delivered), dead (out of
+    attempts), oldest_pending_seconds, and the average and maximum delivery
+    latency over the last hour.
+    """
+    config = config or get_config()
+    now = timezone.now()
+    undelivered = OutboxMessage.objects.filter(delivered_at__isnull=True)
+    pending = undelivered.filter(attempts__lt=config['MAX_ATTEMPTS'])
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    latencies = [
+        (delivered_at - created_at).total_seconds()
+        for created_at, delivered_at in OutboxMessage.objects.filter(
+            delivered_at__gte=now - timedelta(hours=1)
+        ).values_list('created_at', 'delivered_at')
+    ]
+    return {
+        'pending': pending.count(),
+        'dead': undelivered.filter(attempts__gte=config['MAX_ATTEMPTS']).count(),
+        'oldest_pending_seconds': (now - oldest).total_seconds() if oldest else 0,
+        'delivered_last_hour': len(latencies),
+        'avg_latency_seconds': sum(latencies) / len(latencies) if latencies else 0,
+        'max_latency_seconds': max(latencies, default=0),
+    }
+
+
+def prune(config=None):
+    """Deletes delivered messages older than RETENTION_HOURS. Returns the count."""
+    config = config or get_config()
+    cutoff = timezone.now() - timedelta(hours=config['RETENTION_HOURS'])
+    deleted, _ = OutboxMessage.objects.filter(delivered_at__lt=cutoff).delete()
+    return deleted
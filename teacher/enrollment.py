@@ -0,0 +1,122 @@
+"""
+Process-local index of class membership.
+
+Scan validation only needs to know whether a student belongs to a class, so
+each class's roster is loaded once into a frozenset of student ids and
+answered from memory afterwards. Rosters are built lazily and dropped when
+Class.students changes (see teacher.signals).
+
+Other worker processes cannot invalidate this process's copy, so entries also
+expire after ENROLLMENT_CACHE_TTL seconds, and a student missing from a
+cached roster is confirmed against the database before being rejected.
+Scans accept a cached positive answer; write paths that must not act on a
+stale roster (enrolling, unenrolling, manual marking) pass confirm=True to
+have positives confirmed as well.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Class
+
+_rosters = {}
+_lock = threading.Lock()
+_generation = 0
+
+
+def _ttl():
+    return getattr(settings, 'ENROLLMENT_CACHE_TTL', 300)
+
+
+def _cached(class_id):
+    """Returns (roster or None, generation) for a class."""
+    with _lock:
+        entry = _rosters.get(class_id)
+        generation = _generation
+    if entry is not None and time.monotonic() - entry[1] < _ttl():
+        return entry[0], generation
+    return None, generation
+
+
+def _store(class_id, student_ids, generation, loaded_at):
+    with _lock:
+        # Don't store a roster that was invalidated while it was being read
+        if generation == _generation:
+            _rosters[class_id] = (student_ids, loaded_at)
+
+
+def _roster_query(class_id):
+    return Class.students.through.objects.filter(class_id=class_id).values_list('customuser_id', flat=True)
+
+
+def _membership_query(class_id, student_id):
+    return Class.students.through.objects.filter(class_id=class_id, customuser_id=student_id)
+
+
+def members(class_id):
+    """Returns the frozenset of student ids enrolled in a class."""
+    student_ids, generation = _cached(class_id)
+    if student_ids is not None:
+        return student_ids
+
+    loaded_at = time.monotonic()
+    student_ids = frozenset(_roster_query(class_id))
+    _store(class_id, student_ids, generation, loaded_at)
+    return student_ids
+
+
+async def amembers(class_id):
+    student_ids, generation = _cached(class_id)
+    if student_ids is not None:
+        return student_ids
+
+    loaded_at = time.monotonic()
+    student_ids = frozenset([student_id async for student_id in _roster_query(class_id)])
+    _store(class_id, student_ids, generation, loaded_at)
+    return student_ids
+
+
+def _reconcile(class_id, student_id, enrolled):
+    # Drop a cached roster that disagrees with the database
+    roster, _ = _cached(class_id)
+    if roster is not None and (student_id in roster) != enrolled:
+        invalidate([class_id])
+
+
+def is_enrolled(class_id, student_id, confirm=False):
+    """
+    Whether a student is enrolled in a class. Negative answers are always
+    confirmed against the database, as the roster may predate an enrollment
+    made by another process; with confirm, positive ones are too.
+    """
+    if not confirm and student_id in members(class_id):
+        return True
+    enrolled = _membership_query(class_id, student_id).exists()
+    _reconcile(class_id, student_id, enrolled)
+    return enrolled
+
+
+async def ais_enrolled(class_id, student_id, confirm=False):
+    if not confirm and student_id in await amembers(class_id):
+        return True
+    enrolled = await _membership_query(class_id, student_id).aexists()
+    _reconcile(class_id, student_id, enrolled)
+    return enrolled
+
+
+def invalidate(class_ids=None):
+    """Drops cached rosters for the given classes, or all of them."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if class_ids is None:
+            _rosters.clear()
+        else:
+            for class_id in class_ids:
+                _rosters.pop(class_id, None)
+
+
+def clear():
+    invalidate()
@@ -0,0 +1,249 @@
+"""
+Streaming attendance exports.
+
+An export holds one per-student × per-lecture matrix for each subject it
+covers: a subject, every subject of a class, or every subject of an
+AcademicSession. Students and attendance records are both read with
+.iterator() in student order and merged as they arrive, so only one
+subject's lecture list and one student row are held in memory at a time,
+however many rows the export covers.
+
+write_csv() and write_xlsx() turn the matrices into chunks of bytes for a
+StreamingHttpResponse or a file. In CSV the subjects follow each other,
+separated by a blank row; in XLSX each gets its own worksheet.
+"""
+
+import csv
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Attendance, Lecture, Subject
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+CELLS = {
+    'approved': 'P',
+    'pending': 'Pending',
+}
+ABSENT = 'A'
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def subjects_for(scope, obj, user=None):
+    """
+    The subjects an export of a subject, class or session covers, limited to
+    the ones user teaches unless user is None or staff.
+    """
+    subjects = Subject.objects.select_related('class_obj__course').order_by('class_obj__name', 'name', 'id')
+    subjects = subjects.filter(**{
+        'subject': {'pk': obj.pk},
+        'class': {'class_obj': obj.pk},
+        'session': {'class_obj__session': obj.pk},
+    }[scope])
+    if user is not None and not user.is_staff:
+        subjects = subjects.filter(teacher=user)
+    return subjects
+
+
+def subject_rows(subject, chunk_size=None):
+    """Yields the header row, then one row per enrolled student."""
+    chunk_size = chunk_size or _chunk_size()
+    lectures = list(Lecture.objects.filter(subject=subject).order_by('date', 'time', 'id').values_list('id', 'date', 'time'))
+    columns = {lecture_id: index for index, (lecture_id, _, _) in enumerate(lectures)}
+
+    yield ['Student', 'Email', 'Roll No.'] + [
+        f'{lecture_date:%Y-%m-%d} {lecture_time:%H:%M}' for _, lecture_date, lecture_time in lectures
+    ] + ['Attended', 'Total', 'Percentage']
+
+    students = subject.class_obj.students.order_by('id').values_list('id', 'name', 'email', 'roll_no').iterator(chunk_size)
+    records = Attendance.objects.filter(lecture__subject=subject).order_by('student_id').values_list(
+        'student_id', 'lecture_id', 'status'
+    ).iterator(chunk_size)
+
+    record = next(records, None)
+    for student_id, name, email, roll_no in students:
+        cells = [ABSENT] * len(lectures)
+        # Records of students who have since left the class are skipped
+        while record is not None and record[0] <= student_id:
+            if record[0] == student_id and cells[columns[record[1]]] != CELLS['approved']:
+                cells[columns[record[1]]] = CELLS.get(record[2], ABSENT)
+            record = next(records, None)
+
+        attended = cells.count(CELLS['approved'])
+        percentage = round(attended / len(lectures) * 100) if lectures else 0
+        yield [name, email, roll_no or ''] + cells + [attended, len(lectures), percentage]
+
+
+def title(subject):
+    return f'{subject.name} ({subject.class_obj.course.name}, {subject.class_obj.name})'
+
+
+class _Pipe:
+    """A write-only file whose contents are taken out with drain()."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(part.encode() if isinstance(part, str) else part for part in self.parts)
+        self.parts = []
+        return data
+
+
+def write_csv(subjects, rows_per_chunk=500):
+    """Yields the export as UTF-8 CSV, a few hundred rows per chunk."""
+    pipe = _Pipe()
+    writer = csv.writer(pipe)
+    pipe.write('\ufeff')  # so spreadsheet programs detect UTF-8
+    for index, subject in enumerate(subjects):
+        if index:
+            writer.writerow([])
+        writer.writerow([title(subject)])
+        for count, row in enumerate(subject_rows(subject), 1):
+            writer.writerow(row)
+            if count % rows_per_chunk == 0:
+                yield pipe.drain()
+        yield pipe.drain()
+
+
+def _column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _xlsx_row(number, values):
+    cells = []
+    for index, value in enumerate(values):
+        ref = f'{_column_name(index)}{number}'
+        if isinstance(value, int):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def _sheet_names(subjects):
+    used = set()
+    for subject in subjects:
+        base = ''.join('_' if char in '[]:*?/\\' else char for char in subject.name)[:31] or 'Sheet'
+        name, suffix = base, 1
+        while name.lower() in used:
+            suffix += 1
+            name = f'{base[:31 - len(str(suffix)) - 1]} {suffix}'
+        used.add(name.lower())
+        yield subject, name
+
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{overrides}</Types>'
+)
+XLSX_SHEET_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{number}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{relationships}</Relationships>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+def write_xlsx(subjects, rows_per_chunk=500):
+    """
+    Yields the export as an XLSX workbook with one worksheet per subject.
+    The zip is written without seeking, so each chunk can be sent as soon
+    as it is compressed. A workbook needs at least one sheet, so an export
+    without subjects gets an empty one.
+    """
+    pipe = _Pipe()
+    sheets = []
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for number, (subject, name) in enumerate(_sheet_names(subjects), 1):
+            sheets.append(name)
+            with workbook.open(f'xl/worksheets/sheet{number}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(XLSX_SHEET_START.encode())
+                sheet.write(_xlsx_row(1, [title(subject)]).encode())
+                for row_number, row in enumerate(subject_rows(subject), 2):
+                    sheet.write(_xlsx_row(row_number, row).encode())
+                    if row_number % rows_per_chunk == 0:
+                        yield pipe.drain()
+                sheet.write(XLSX_SHEET_END.encode())
+            yield pipe.drain()
+
+        if not sheets:
+            sheets.append('Sheet1')
+            workbook.writestr('xl/worksheets/sheet1.xml', XLSX_SHEET_START + XLSX_SHEET_END)
+        numbers = range(1, len(sheets) + 1)
+        workbook.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES.format(
+            overrides=''.join(XLSX_SHEET_TYPE.format(number=number) for number in numbers)
+        ))
+        workbook.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        workbook.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(sheets=''.join(
+            f'<sheet name={quoteattr(name)} sheetId="{number}" r:id="rId{number}"/>'
+            for number, name in zip(numbers, sheets)
+        )))
+        workbook.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS.format(relationships=''.join(
+            f'<Relationship Id="rId{number}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{number}.xml"/>'
+            for number in numbers
+        )))
+    yield pipe.drain()
+
+
+async def iterate_async(chunks):
+    """
+    Pulls a writer's chunks from the thread that runs sync code, where its
+    database cursors live. ASGI servers would otherwise read a synchronous
+    stream into memory before sending it.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+WRITERS = {
+    'csv': write_csv,
+    'xlsx': write_xlsx,
+}
@@ -0,0 +1,91 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from ams.channel_layer import SQLiteChannelLayer
+
+GROUP = 'bench'
+
+
+def run_worker(path, messages, ready, results):
+    """Joins the group like a lecture socket would and drains its messages."""
+    async def consume():
+        layer = SQLiteChannelLayer(path=path, capacity=messages + 1)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.put(os.getpid())
+        received = 0
+        while received < messages:
+            await layer.receive(channel)
+            received += 1
+        results.put((os.getpid(), received, time.time()))
+        await layer.close()
+
+    asyncio.run(consume())
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures SQLiteChannelLayer throughput: one sender fans group messages out to '
+        'N worker processes, for each worker count given.'
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--workers',
+            default='1,2,4,8',
+            help='Comma-separated worker process counts to benchmark.'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=1000,
+            help='The number of group messages sent per run.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            worker_counts = [int(count) for count in options['workers'].split(',') if count.strip()]
+        except ValueError:
+            raise CommandError('--workers must be a comma-separated list of integers.')
+
+        messages = options['messages']
+        self.stdout.write(f'{"workers":>8} {"sent/s":>10} {"delivered/s":>12} {"seconds":>8}')
+        for workers in worker_counts:
+            sent_rate, delivered_rate, elapsed = self.run(workers, messages)
+            self.stdout.write(f'{workers:>8} {sent_rate:>10.0f} {delivered_rate:>12.0f} {elapsed:>8.2f}')
+
+    def run(self, workers, messages):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'channels.sqlite3')
+            context = multiprocessing.get_context('spawn')
+            ready, results = context.Queue(), context.Queue()
+            processes = [
+                context.Process(target=run_worker, args=(path, messages, ready, results), daemon=True)
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                ready.get(timeout=60)
+
+            layer = SQLiteChannelLayer(path=path, capacity=messages + 1)
+
+            async def send_all():
+                for i in range(messages):
+                    await layer.group_send(GROUP, {'type': 'attendance.update', 'data': {'attendance_id': i}})
+
+            started = time.time()
+            asyncio.run(send_all())
+            sent = time.time()
+            finished = max(results.get(timeout=300)[2] for _ in processes)
+            for process in processes:
+                process.join()
+            asyncio.run(layer.close())
+
+        elapsed = finished - started
+        return messages / (sent - started), messages * workers / elapsed, elapsed
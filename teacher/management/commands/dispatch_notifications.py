@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from teacher import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued notifications from the outbox (NOTIFICATIONS MODE "outbox").'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Deliver everything currently due, then exit.'
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue depth and delivery latency, then exit.'
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=int,
+            default=60,
+            help='Seconds between metrics lines (and pruning of old delivered messages) while running.'
+        )
+
+    def handle(self, *args, **options):
+        config = dispatcher.get_config()
+        if options['stats']:
+            self.write_stats(config)
+            return
+
+        next_stats = time.monotonic() + options['stats_interval']
+        try:
+            while True:
+                result = dispatcher.dispatch_batch(config)
+                if result['claimed']:
+                    latencies = result['latencies']
+                    self.stdout.write(
+                        f"Delivered {result['delivered']} of {result['claimed']} message(s), "
+                        f"{result['failed']} failed; "
+                        f"max latency {max(latencies, default=0) * 1000:.0f} ms"
+                    )
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(config['POLL_INTERVAL_MS'] / 1000)
+
+                if time.monotonic() >= next_stats:
+                    next_stats = time.monotonic() + options['stats_interval']
+                    dispatcher.prune(config)
+                    self.write_stats(config)
+        except KeyboardInterrupt:
+            pass
+
+    def write_stats(self, config):
+        stats = dispatcher.stats(config)
+        self.stdout.write(
+            f"Outbox: {stats['pending']} pending (oldest {stats['oldest_pending_seconds']:.1f}s), "
+            f"{stats['dead']} out of attempts; "
+            f"{stats['delivered_last_hour']} delivered in the last hour, "
+            f"latency avg {stats['avg_latency_seconds'] * 1000:.0f} ms / max {stats['max_latency_seconds'] * 1000:.0f} ms"
+        )
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from teacher import exports
+from teacher.models import AcademicSession, Class, Subject
+
+SCOPES = {
+    'subject': Subject,
+    'class': Class,
+    'session': AcademicSession,
+}
+
+
+class Command(BaseCommand):
+    help = 'Writes the per-lecture attendance matrix of a subject, class or academic session as CSV or XLSX.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scope', choices=SCOPES)
+        parser.add_argument('id', type=int, help='ID of the subject, class or session.')
+        parser.add_argument('--format', choices=exports.WRITERS, default='csv')
+        parser.add_argument('--output', '-o', default='-', help='File to write to; - (the default) writes to stdout.')
+
+    def handle(self, *args, **options):
+        model = SCOPES[options['scope']]
+        try:
+            obj = model.objects.get(pk=options['id'])
+        except model.DoesNotExist:
+            raise CommandError(f"{model._meta.verbose_name.capitalize()} {options['id']} does not exist.")
+
+        subjects = list(exports.subjects_for(options['scope'], obj))
+        chunks = exports.WRITERS[options['format']](subjects)
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {len(subjects)} subject(s) to {options['output']}."
+        ))
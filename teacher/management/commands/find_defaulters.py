@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from teacher import defaulters
+
+
+class Command(BaseCommand):
+    help = 'Finds the students below the attendance threshold in every subject of the active session.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Attendance percentage below which a student is listed (default: DEFAULTER_THRESHOLD).')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only recheck subjects whose attendance, lectures or roster changed since the last run.')
+
+    def handle(self, *args, **options):
+        subjects, found = defaulters.refresh(threshold=options['threshold'], incremental=options['incremental'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {subjects} subject(s); found {found} defaulter(s).'))
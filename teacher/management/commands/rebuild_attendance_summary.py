@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from teacher import summary
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the lecture and approved-attendance totals used by reports from the raw records.'
+
+    def handle(self, *args, **options):
+        subjects, students = summary.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt attendance summaries for {subjects} subject(s) and {students} student/subject pair(s).'
+        ))
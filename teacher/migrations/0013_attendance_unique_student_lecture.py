@@ -0,0 +1,42 @@
+# Generated by Django 4.2.1 on 2026-10-17 15:53
+
+from django.db import migrations, models
+from django.db.models import Count
+
+STATUS_RANK = {'approved': 0, 'pending': 1, 'rejected': 2}
+
+
+def remove_duplicate_attendance(apps, schema_editor):
+    """
+    Keeps one record per (student, lecture) before the unique constraint is
+    added: the one with the most decisive status, then the earliest.
+    """
+    Attendance = apps.get_model('teacher', 'Attendance')
+    duplicates = (
+        Attendance.objects.filter(lecture__isnull=False)
+        .values('student_id', 'lecture_id')
+        .annotate(records=Count('id'))
+        .filter(records__gt=1)
+    )
+    for duplicate in list(duplicates):
+        records = list(
+            Attendance.objects.filter(student_id=duplicate['student_id'], lecture_id=duplicate['lecture_id'])
+            .values_list('id', 'status')
+        )
+        records.sort(key=lambda record: (STATUS_RANK.get(record[1], len(STATUS_RANK)), record[0]))
+        Attendance.objects.filter(id__in=[record[0] for record in records[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0012_attendance_rejection_reason_attendance_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_attendance, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('student', 'lecture'), name='unique_attendance_per_lecture'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-17 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0013_attendance_unique_student_lecture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Changes on every write; used as the cursor for live feeds.'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['lecture', 'updated_at'], name='attendance_lecture_updated'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.1 on 2026-10-17 16:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def build_summaries(apps, schema_editor):
+    Lecture = apps.get_model('teacher', 'Lecture')
+    Attendance = apps.get_model('teacher', 'Attendance')
+    SubjectSummary = apps.get_model('teacher', 'SubjectSummary')
+    StudentSubjectSummary = apps.get_model('teacher', 'StudentSubjectSummary')
+
+    SubjectSummary.objects.bulk_create([
+        SubjectSummary(subject_id=row['subject'], lecture_count=row['count'])
+        for row in Lecture.objects.values('subject').annotate(count=Count('id')).order_by()
+    ])
+    StudentSubjectSummary.objects.bulk_create([
+        StudentSubjectSummary(subject_id=row['lecture__subject'], student_id=row['student'], approved_count=row['count'])
+        for row in Attendance.objects.filter(status='approved', lecture__isnull=False)
+        .values('lecture__subject', 'student').annotate(count=Count('id')).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('teacher', '0015_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectSummary',
+            fields=[
+                ('subject', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='teacher.subject')),
+                ('lecture_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentSubjectSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approved_count', models.IntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_summaries', to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_summaries', to='teacher.subject')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='studentsubjectsummary',
+            constraint=models.UniqueConstraint(fields=('subject', 'student'), name='unique_summary_per_subject_student'),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
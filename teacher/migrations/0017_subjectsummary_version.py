@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-17 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0016_attendance_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subjectsummary',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped whenever the subject's report data changes; keys cached reports."),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.1 on 2026-10-17 16:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('teacher', '0017_subjectsummary_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subjectsummary',
+            name='defaulters_threshold',
+            field=models.FloatField(blank=True, help_text="The threshold the subject's Defaulter rows were computed with.", null=True),
+        ),
+        migrations.AddField(
+            model_name='subjectsummary',
+            name='defaulters_version',
+            field=models.PositiveIntegerField(blank=True, help_text="The version the subject's Defaulter rows were computed at.", null=True),
+        ),
+        migrations.CreateModel(
+            name='Defaulter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attended', models.IntegerField()),
+                ('total_lectures', models.IntegerField()),
+                ('percentage', models.FloatField()),
+                ('threshold', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='defaulted_subjects', to=settings.AUTH_USER_MODEL)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='defaulters', to='teacher.subject')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='defaulter',
+            constraint=models.UniqueConstraint(fields=('subject', 'student'), name='unique_defaulter_per_subject_student'),
+        ),
+    ]
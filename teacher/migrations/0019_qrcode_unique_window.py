@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-17 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teacher', '0018_defaulters'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='qrcode',
+            constraint=models.UniqueConstraint(fields=('lecture', 'expires_at'), name='unique_qrcode_per_lecture_window'),
+        ),
+    ]
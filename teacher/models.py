@@ -1,6 +1,8 @@
 import uuid
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import connections, models, transaction, IntegrityError
 from django.conf import settings
+from django.utils import timezone
 
 class Course(models.Model):
     name = models.CharField(max_length=255, unique=True, help_text="e.g., 'B.Sc. Computer Science'")
@@ -50,6 +52,165 @@ class Lecture(models.Model):
         return f"Lecture for {self.subject.name} ({self.subject.class_obj.name}) on {self.date} at {self.time}"
 
 
+class AttendanceManager(models.Manager):
+    """
+    Single-statement write paths for scans, built on the unique
+    (student, lecture) constraint with INSERT ... ON CONFLICT ... RETURNING.
+    Backends without RETURNING support fall back to get_or_create.
+    """
+
+    def _upsert(self, obj, update_fields=None, update_where=None):
+        connection = connections[self.db]
+        opts = self.model._meta
+        fields = [f for f in opts.concrete_fields if not f.primary_key]
+        values = [f.get_db_prep_save(f.pre_save(obj, add=True), connection) for f in fields]
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s, %s) ' % (
+            table,
+            ', '.join(qn(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+            qn(opts.get_field('student').column),
+            qn(opts.get_field('lecture').column),
+        )
+        if update_fields:
+            sql += 'DO UPDATE SET %s' % ', '.join(
+                '%s = EXCLUDED.%s' % (qn(opts.get_field(name).column), qn(opts.get_field(name).column))
+                for name in update_fields
+            )
+            if update_where:
+                sql += ' WHERE %s.%s' % (table, update_where)
+        else:
+            sql += 'DO NOTHING'
+        sql += ' RETURNING %s' % qn(opts.pk.column)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _supports_upsert(self):
+        connection = connections[self.db]
+        return connection.vendor in ('sqlite', 'postgresql') and connection.features.can_return_columns_from_insert
+
+    def record_scan(self, student_id, lecture_id, subject_id, date):
+        """
+        Inserts a pending record unless the student already has one for the
+        lecture. Returns (attendance_id, created); the id is None when the
+        record already existed.
+        """
+        obj = self.model(student_id=student_id, lecture_id=lecture_id, subject_id=subject_id, date=date, status='pending')
+        if self._supports_upsert():
+            attendance_id = self._upsert(obj)
+            return attendance_id, attendance_id is not None
+
+        try:
+            with transaction.atomic(using=self.db):
+                attendance, created = self.get_or_create(
+                    student_id=student_id,
+                    lecture_id=lecture_id,
+                    defaults={'subject_id': subject_id, 'date': date, 'status': 'pending'}
+                )
+        except IntegrityError:
+            return None, False
+        return (attendance.id if created else None), created
+
+    async def arecord_scan(self, student_id, lecture_id, subject_id, date):
+        return await sync_to_async(self.record_scan)(student_id, lecture_id, subject_id, date)
+
+    def approve(self, student_id, lecture_id, subject_id, date):
+        """
+        Creates an approved record, or approves the existing one. Returns the
+        attendance id if a row was inserted or changed, None if the student
+        was already approved. subject_id must be the lecture's subject.
+        """
+        obj = self.model(student_id=student_id, lecture_id=lecture_id, subject_id=subject_id, date=date, status='approved')
+        if self._supports_upsert():
+            from . import summary
+
+            qn = connections[self.db].ops.quote_name
+            with transaction.atomic(using=self.db):
+                attendance_id = self._upsert(
+                    obj,
+                    update_fields=['status', 'rejection_reason', 'updated_at'],
+                    update_where="%s <> 'approved'" % qn('status'),
+                )
+                if attendance_id is not None:
+                    summary.add_approved({(subject_id, student_id): 1})
+            return attendance_id
+
+        attendance, created = self.get_or_create(
+            student_id=student_id,
+            lecture_id=lecture_id,
+            defaults={'subject_id': subject_id, 'date': date, 'status': 'approved'}
+        )
+        if created:
+            return attendance.id
+        if attendance.status != 'approved':
+            attendance.status = 'approved'
+            attendance.rejection_reason = None
+            attendance.save()
+            return attendance.id
+        return None
+
+    def set_status(self, attendance_id, subject_id, student_id, status, rejection_reason=None):
+        """
+        Approves or rejects one record with conditional UPDATEs, so that
+        concurrent changes of the same record (e.g. a double click) adjust
+        the approved totals once. subject_id must be the lecture's subject.
+        """
+        from . import summary
+
+        fields = {'status': status, 'rejection_reason': rejection_reason, 'updated_at': timezone.now()}
+        with transaction.atomic(using=self.db):
+            rows = self.filter(pk=attendance_id)
+            if status == 'approved':
+                change = rows.exclude(status='approved').update(**fields)
+            else:
+                change = -rows.filter(status='approved').update(**fields)
+                if not change:
+                    rows.update(**fields)
+            summary.add_approved({(subject_id, student_id): change})
+
+    def approve_pending(self, lecture):
+        """
+        Approves every pending record of a lecture in one statement. Returns
+        the (attendance_id, student_id) pairs that were approved.
+        """
+        from . import summary
+
+        with transaction.atomic(using=self.db):
+            rows = self._approve_pending(lecture.id)
+            summary.add_approved({(lecture.subject_id, student_id): 1 for _, student_id in rows})
+        return rows
+
+    def _approve_pending(self, lecture_id):
+        now = timezone.now()
+        if not self._supports_upsert():
+            rows = list(
+                self.select_for_update()
+                .filter(lecture_id=lecture_id, status='pending')
+                .values_list('id', 'student_id')
+            )
+            self.filter(pk__in=[attendance_id for attendance_id, _ in rows]).update(status='approved', updated_at=now)
+            return rows
+
+        connection = connections[self.db]
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        status, updated_at, lecture, student = (
+            qn(opts.get_field(name).column) for name in ('status', 'updated_at', 'lecture', 'student')
+        )
+        sql = 'UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s AND %s = %%s RETURNING %s, %s' % (
+            qn(opts.db_table), status, updated_at, lecture, status, qn(opts.pk.column), student,
+        )
+        params = ['approved', opts.get_field('updated_at').get_db_prep_save(now, connection), lecture_id, 'pending']
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+
 class Attendance(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -64,6 +225,26 @@ class Attendance(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     rejection_reason = models.CharField(max_length=255, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Changes on every write; used as the cursor for live feeds.")
+
+    objects = AttendanceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'lecture'], name='unique_attendance_per_lecture'),
+        ]
+        indexes = [
+            models.Index(fields=['lecture', 'updated_at'], name='attendance_lecture_updated'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a save can tell whether the record became or stopped
+        # being approved (see teacher.signals and teacher.summary)
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
 
     def __str__(self):
         lecture_info = self.lecture if self.lecture else f"{self.subject.name if self.subject else 'Unknown'} on {self.date}"
@@ -76,6 +257,51 @@ class HistoricalAttendance(Attendance):
         verbose_name_plural = 'Historical Attendance Records'
 
 
+class SubjectSummary(models.Model):
+    """Number of lectures held for a subject, kept up to date by teacher.summary."""
+    subject = models.OneToOneField(Subject, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    lecture_count = models.IntegerField(default=0)
+    version = models.PositiveIntegerField(default=0, help_text="Bumped whenever the subject's report data changes; keys cached reports.")
+    defaulters_version = models.PositiveIntegerField(null=True, blank=True, help_text="The version the subject's Defaulter rows were computed at.")
+    defaulters_threshold = models.FloatField(null=True, blank=True, help_text="The threshold the subject's Defaulter rows were computed with.")
+
+    def __str__(self):
+        return f"{self.subject.name}: {self.lecture_count} lecture(s)"
+
+
+class StudentSubjectSummary(models.Model):
+    """A student's approved attendance count in a subject, kept up to date by teacher.summary."""
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='student_summaries')
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='subject_summaries')
+    approved_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'student'], name='unique_summary_per_subject_student'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.name} in {self.subject.name}: {self.approved_count} approved"
+
+
+class Defaulter(models.Model):
+    """A student below the attendance threshold in a subject, as of the last find_defaulters run (see teacher.defaulters)."""
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='defaulters')
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='defaulted_subjects')
+    attended = models.IntegerField()
+    total_lectures = models.IntegerField()
+    percentage = models.FloatField()
+    threshold = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'student'], name='unique_defaulter_per_subject_student'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.name} in {self.subject.name}: {self.percentage:.0f}%"
+
 
 class QRCode(models.Model):
     lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, related_name='qr_codes', null=True, blank=True)
@@ -83,5 +309,36 @@ class QRCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
 
+    class Meta:
+        constraints = [
+            # One token per lecture and rotation window (see teacher.tokens)
+            models.UniqueConstraint(fields=['lecture', 'expires_at'], name='unique_qrcode_per_lecture_window'),
+        ]
+
+    def __str__(self):
+        return f"QRCode for {self.lecture}"
+
+
+class OutboxMessage(models.Model):
+    """A notification waiting for the dispatch_notifications worker (see teacher.dispatcher)."""
+    KIND_CHOICES = (
+        ('group', 'Channel group event'),
+        ('email', 'Email'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    recipient = models.CharField(max_length=255, help_text="A channel group name or an email address.")
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not delivered before this time; pushed back on retries.")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivered_at', 'available_at'], name='outbox_due'),
+        ]
+
     def __str__(self):
-        return f"QRCode for {self.lecture}"
\ No newline at end of file
+        return f"{self.get_kind_display()} to {self.recipient}"
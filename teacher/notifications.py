@@ -0,0 +1,124 @@
+"""
+Channel-layer and email notifications for attendance changes.
+
+Teachers' live lecture pages listen on the group attendance_<lecture_id>;
+students listen on student_<student_id> (see student.consumers).
+
+With NOTIFICATIONS['MODE'] set to 'inline' (the default) notifications are
+sent from the calling thread. With 'outbox' they are written to the
+OutboxMessage table, in the caller's transaction, and delivered by the
+dispatch_notifications worker (see teacher.dispatcher), which keeps channel
+sends and SMTP off the request path and retries failed deliveries.
+"""
+
+import asyncio
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .models import OutboxMessage
+
+
+def lecture_group(lecture_id):
+    return f"attendance_{lecture_id}"
+
+
+def student_group(student_id):
+    return f"student_{student_id}"
+
+
+def dispatch_mode():
+    return getattr(settings, 'NOTIFICATIONS', {}).get('MODE', 'inline')
+
+
+def _outbox_rows(events):
+    return [OutboxMessage(kind='group', recipient=group, payload=event) for group, event in events]
+
+
+async def send_group_events(events):
+    """Sends (group, event) pairs concurrently on the channel layer."""
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(channel_layer.group_send(group, event) for group, event in events))
+
+
+def publish(events):
+    """
+    Delivers (group, event) pairs: inline in a single hop into the event
+    loop, or through the outbox.
+    """
+    if not events:
+        return
+    if dispatch_mode() == 'outbox':
+        OutboxMessage.objects.bulk_create(_outbox_rows(events))
+    else:
+        async_to_sync(send_group_events)(events)
+
+
+async def apublish(events):
+    if not events:
+        return
+    if dispatch_mode() == 'outbox':
+        await sync_to_async(OutboxMessage.objects.bulk_create)(_outbox_rows(events))
+    else:
+        await send_group_events(events)
+
+
+def lecture_event(updates):
+    """
+    One attendance_update event for a single change, or one attendance_batch
+    event for several. Each update is a dict with at least attendance_id and
+    status.
+    """
+    if len(updates) == 1:
+        return {"type": "attendance_update", "data": updates[0]}
+    return {"type": "attendance_batch", "data": updates}
+
+
+def send_lecture_updates(lecture_id, updates):
+    """Pushes attendance changes to a lecture's live page."""
+    if updates:
+        publish([(lecture_group(lecture_id), lecture_event(updates))])
+
+
+async def asend_lecture_updates(lecture_id, updates):
+    if updates:
+        await apublish([(lecture_group(lecture_id), lecture_event(updates))])
+
+
+def send_status_update(student_id, message):
+    """Tells a student their attendance was approved or rejected."""
+    send_status_updates([student_id], message)
+
+
+def send_status_updates(student_ids, message):
+    """Sends the same status message to many students."""
+    send_status_messages([(student_id, message) for student_id in student_ids])
+
+
+def send_status_messages(messages):
+    """Sends each (student_id, message) pair's status message."""
+    publish([
+        (student_group(student_id), {
+            "type": "attendance_status_update",
+            "message": message,
+        })
+        for student_id, message in messages
+    ])
+
+
+def send_email(subject, body, recipient_list, from_email=None):
+    """Sends a plain-text email now, or queues one per recipient in outbox mode."""
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    if dispatch_mode() == 'outbox':
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(kind='email', recipient=recipient, payload={
+                'subject': subject,
+                'body': body,
+                'from_email': from_email,
+            })
+            for recipient in recipient_list
+        ])
+    else:
+        send_mail(subject, body, from_email, recipient_list, fail_silently=False)
@@ -0,0 +1,190 @@
+"""
+Process-local cache of live QR tokens.
+
+Every student in a lecture scans the same token inside its short validity
+window, so the scan path resolves tokens from this cache instead of reading
+the QRCode row back on every request. Entries are added when a token is
+issued, dropped once they expire, and loaded from the database on a miss.
+
+The lecture, subject and class a token points at are cached separately by
+lecture id, so signed tokens (see teacher.tokens) resolve without a query.
+Saving or deleting a lecture evicts its entry in this process (see
+teacher.signals); entries are also re-read after LECTURE_TTL_SECONDS, so
+changes made by other workers reach this one too.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.utils import timezone
+
+from .models import Lecture, QRCode
+
+LECTURE_FIELDS = [
+    'lecture_id',
+    'lecture_date',
+    'subject_id',
+    'subject_name',
+    'class_id',
+    'class_name',
+]
+
+LectureInfo = namedtuple('LectureInfo', LECTURE_FIELDS)
+ActiveToken = namedtuple('ActiveToken', LECTURE_FIELDS + ['expires_at'])
+
+MAX_LECTURES = 1024
+LECTURE_TTL_SECONDS = 60
+
+_tokens = {}
+_lectures = OrderedDict()
+_lock = threading.Lock()
+
+
+def _normalize(qr_code_data):
+    try:
+        return str(uuid.UUID(str(qr_code_data)))
+    except ValueError:
+        return None
+
+
+def _purge_expired(now):
+    expired = [key for key, token in _tokens.items() if token.expires_at <= now]
+    for key in expired:
+        del _tokens[key]
+
+
+def remember_lecture(lecture):
+    """Caches the ids and names the scan path needs for a lecture."""
+    subject = lecture.subject
+    info = LectureInfo(
+        lecture_id=lecture.id,
+        lecture_date=lecture.date,
+        subject_id=subject.id,
+        subject_name=subject.name,
+        class_id=subject.class_obj_id,
+        class_name=subject.class_obj.name,
+    )
+    with _lock:
+        _lectures[lecture.id] = (info, time.monotonic())
+        _lectures.move_to_end(lecture.id)
+        while len(_lectures) > MAX_LECTURES:
+            _lectures.popitem(last=False)
+    return info
+
+
+def _cached_lecture(lecture_id):
+    with _lock:
+        entry = _lectures.get(lecture_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= LECTURE_TTL_SECONDS:
+            del _lectures[lecture_id]
+            return None
+        _lectures.move_to_end(lecture_id)
+        return entry[0]
+
+
+def forget_lecture(lecture_id):
+    """Evicts a lecture and the tokens pointing at it."""
+    with _lock:
+        _lectures.pop(lecture_id, None)
+        for key in [key for key, token in _tokens.items() if token.lecture_id == lecture_id]:
+            del _tokens[key]
+
+
+def lecture_info(lecture_id):
+    """Returns the LectureInfo for a lecture id, or None if it doesn't exist."""
+    info = _cached_lecture(lecture_id)
+    if info is not None:
+        return info
+
+    try:
+        lecture = Lecture.objects.select_related('subject__class_obj').get(pk=lecture_id)
+    except Lecture.DoesNotExist:
+        return None
+    return remember_lecture(lecture)
+
+
+async def alecture_info(lecture_id):
+    info = _cached_lecture(lecture_id)
+    if info is not None:
+        return info
+
+    try:
+        lecture = await Lecture.objects.select_related('subject__class_obj').aget(pk=lecture_id)
+    except Lecture.DoesNotExist:
+        return None
+    return remember_lecture(lecture)
+
+
+def remember(qr_code, lecture=None):
+    """
+    Caches a QRCode linked to a lecture. Pass the lecture (with its subject
+    and class loaded) when the caller already has it to avoid extra queries.
+    """
+    lecture = lecture or qr_code.lecture
+    if lecture is None:
+        return None
+
+    token = ActiveToken(*remember_lecture(lecture), expires_at=qr_code.expires_at)
+
+    now = timezone.now()
+    with _lock:
+        _purge_expired(now)
+        if token.expires_at > now:
+            _tokens[str(qr_code.qr_code_data)] = token
+    return token
+
+
+def _cached_token(key):
+    now = timezone.now()
+    with _lock:
+        token = _tokens.get(key)
+        if token is not None and token.expires_at <= now:
+            del _tokens[key]
+    return token
+
+
+def lookup(qr_code_data):
+    """
+    Resolves a scanned token to an ActiveToken, or None if it is unknown or
+    not linked to a lecture. Expired tokens are returned (so callers can tell
+    "expired" from "invalid") but are never kept in the cache.
+    """
+    key = _normalize(qr_code_data)
+    if key is None:
+        return None
+
+    token = _cached_token(key)
+    if token is not None:
+        return token
+
+    try:
+        qr_code = QRCode.objects.select_related('lecture__subject__class_obj').get(qr_code_data=key)
+    except QRCode.DoesNotExist:
+        return None
+    return remember(qr_code)
+
+
+async def alookup(qr_code_data):
+    key = _normalize(qr_code_data)
+    if key is None:
+        return None
+
+    token = _cached_token(key)
+    if token is not None:
+        return token
+
+    try:
+        qr_code = await QRCode.objects.select_related('lecture__subject__class_obj').aget(qr_code_data=key)
+    except QRCode.DoesNotExist:
+        return None
+    return remember(qr_code)
+
+
+def clear():
+    with _lock:
+        _tokens.clear()
+        _lectures.clear()
@@ -0,0 +1,73 @@
+"""
+Server-side rendering of lecture QR codes.
+
+Rendered images are kept in a small LRU keyed by (token, format) so a
+projector page that reloads, or several screens showing the same lecture,
+render each token once. Entries expire after QR_IMAGE_CACHE_TTL seconds,
+which only needs to outlive a token's rotation period.
+"""
+
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+MAX_IMAGES = 256
+
+_images = OrderedDict()
+_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, 'QR_IMAGE_CACHE_TTL', 120)
+
+
+def etag(token, fmt):
+    return '"%s"' % hashlib.sha256(f'{fmt}:{token}'.encode()).hexdigest()[:32]
+
+
+def _render(token, fmt):
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
+    qr.add_data(token)
+    qr.make(fit=True)
+    if fmt == 'svg':
+        image = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        image = qr.make_image(fill_color='black', back_color='white')
+    buffer = io.BytesIO()
+    image.save(buffer)
+    return buffer.getvalue()
+
+
+def render(token, fmt='svg'):
+    """Returns the image bytes of a token's QR code as 'svg' or 'png'."""
+    key = (token, fmt)
+    now = time.monotonic()
+    with _lock:
+        entry = _images.get(key)
+        if entry is not None and now - entry[1] < _ttl():
+            _images.move_to_end(key)
+            return entry[0]
+
+    data = _render(token, fmt)
+    with _lock:
+        _images[key] = (data, now)
+        _images.move_to_end(key)
+        while len(_images) > MAX_IMAGES:
+            _images.popitem(last=False)
+    return data
+
+
+def clear():
+    with _lock:
+        _images.clear()
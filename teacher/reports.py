@@ -0,0 +1,83 @@
+"""
+Attendance reports shared by the teacher's report page and its JSON
+endpoints.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from . import summary
+from .models import StudentSubjectSummary
+
+
+def build_subject_report(subject):
+    """
+    Returns a subject's attendance report in two queries, however large the
+    class: the subject's lecture count, and the class roster annotated with
+    each student's approved attendance count, both read from the
+    maintained summaries (see teacher.summary).
+
+    The result is a dict with total_lectures, total_students,
+    average_attendance (a percentage) and students, a list of dicts with
+    student_id, student_name, total_attended, total_missed and
+    attendance_percentage (unrounded).
+    """
+    total_lectures = summary.lecture_count(subject.pk)
+    approved = StudentSubjectSummary.objects.filter(
+        subject=subject, student=OuterRef('pk')
+    ).values('approved_count')[:1]
+    roster = get_user_model().objects.filter(enrolled_classes=subject.class_obj_id).annotate(
+        total_attended=Coalesce(Subquery(approved), 0)
+    ).values_list('id', 'name', 'total_attended')
+    students = []
+    for student_id, name, attended in roster:
+        students.append({
+            'student_id': student_id,
+            'student_name': name,
+            'total_attended': attended,
+            'total_missed': total_lectures - attended,
+            'attendance_percentage': (attended / total_lectures) * 100 if total_lectures > 0 else 0,
+        })
+
+    total_students = len(students)
+    average = sum(student['attendance_percentage'] for student in students) / total_students if total_students > 0 else 0
+    return {
+        'total_lectures': total_lectures,
+        'total_students': total_students,
+        'average_attendance': average,
+        'students': students,
+    }
+
+
+def cached_report_response(request, endpoint, subject_id, build, user_id=None):
+    """
+    Returns the JSON payload from build() for a subject's report endpoint,
+    cached under the subject's summary version so any attendance or lecture
+    change makes a fresh one. Pass user_id for payloads that differ per user.
+
+    The response's ETag names the version too, so a client that already
+    holds the current data gets a 304 without the payload being looked up.
+    """
+    key = f'report:{endpoint}:{subject_id}:{summary.version(subject_id)}'
+    if user_id is not None:
+        key += f':{user_id}'
+    etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        payload = cache.get(key)
+        if payload is None:
+            payload = build()
+            cache.set(key, payload, getattr(settings, 'REPORT_CACHE_TTL', 300))
+        response = JsonResponse(payload)
+    response['ETag'] = etag
+    # Revalidate every time; unchanged data costs a 304
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
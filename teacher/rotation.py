@@ -0,0 +1,129 @@
+"""
+Rotation of the QR tokens shown on live lecture pages.
+
+Each AttendanceConsumer registers its lecture with the process's
+RotationScheduler on connect and unregisters it on disconnect. A single
+asyncio task sleeps until the earliest current token expires, issues the
+next token for every lecture that is due (see tokens.issue_token) and pushes
+it to the lecture's group as a qr_rotate event, so open pages swap the image
+instead of reloading.
+
+Each worker process schedules the lectures its own sockets follow. When a
+lecture's sockets are spread over several workers, each of them pushes the
+new token. issue_token gives every worker the same token for a window in
+both modes (in 'uuid' mode a unique (lecture, expires_at) constraint lets
+only the first worker's QRCode row in), so pages just see it twice.
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from urllib.parse import quote
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.urls import reverse
+from django.utils import timezone
+
+from . import notifications, tokens
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a lecture whose rotation failed
+RETRY_SECONDS = 5
+
+
+def token_payload(lecture_id, token, expires_at):
+    """The qr_rotate event data: what the page needs to show a token."""
+    image_url = reverse('teacher:lecture_qr_image', args=[lecture_id, 'svg'])
+    return {
+        'token': token,
+        'expires_at': expires_at.isoformat(),
+        'image_url': f'{image_url}?token={quote(token, safe="")}',
+    }
+
+
+class RotationScheduler:
+
+    def __init__(self):
+        self.loop = None
+        self.lectures = {}  # lecture_id -> [lecture, expires_at, watchers]
+        self.task = None
+        self.wakeup = None
+
+    def _bind(self):
+        # Consumers of one server share a loop; tests may run several in turn
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.lectures = {}
+            self.task = None
+            self.wakeup = asyncio.Event()
+
+    async def watch(self, lecture):
+        """
+        Starts rotating a lecture's token while at least one socket follows
+        it. The lecture should have subject__class_obj loaded. Returns the
+        current token's payload, for the newly connected page, or None if
+        it could not be issued; the scheduler then retries shortly.
+        """
+        self._bind()
+        entry = self.lectures.get(lecture.id)
+        if entry is None:
+            # Registered before issuing, so a failure is retried like a failed rotation
+            entry = self.lectures[lecture.id] = [lecture, timezone.now() + timedelta(seconds=RETRY_SECONDS), 0]
+        entry[2] += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+        try:
+            token, expires_at = await database_sync_to_async(tokens.issue_token)(entry[0])
+        except Exception:
+            logger.exception('Could not issue the QR code for lecture %s', lecture.id)
+            return None
+        entry[1] = expires_at
+        self.wakeup.set()
+        return token_payload(lecture.id, token, expires_at)
+
+    def unwatch(self, lecture_id):
+        if self.loop is not asyncio.get_running_loop():
+            return
+        entry = self.lectures.get(lecture_id)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] <= 0:
+            del self.lectures[lecture_id]
+            self.wakeup.set()
+
+    async def run(self):
+        while self.lectures:
+            now = timezone.now()
+            for lecture_id, entry in list(self.lectures.items()):
+                if entry[1] <= now:
+                    await self.rotate(lecture_id, entry)
+
+            if not self.lectures:
+                break
+            next_at = min(entry[1] for entry in self.lectures.values())
+            delay = max(0, (next_at - timezone.now()).total_seconds())
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def rotate(self, lecture_id, entry):
+        try:
+            token, expires_at = await database_sync_to_async(tokens.issue_token)(entry[0])
+            await get_channel_layer().group_send(
+                notifications.lecture_group(lecture_id),
+                {'type': 'qr_rotate', 'data': token_payload(lecture_id, token, expires_at)}
+            )
+        except Exception:
+            logger.exception('Could not rotate the QR code for lecture %s', lecture_id)
+            expires_at = timezone.now() + timedelta(seconds=RETRY_SECONDS)
+        entry[1] = expires_at
+
+
+scheduler = RotationScheduler()
@@ -0,0 +1,114 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from student import attendance_calendar, dashboard
+
+from . import enrollment, qr_cache, summary
+from .models import AcademicSession, Attendance, Class, Course, HistoricalAttendance, Lecture, Subject
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def class_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        class_ids = [instance.pk]
+    elif pk_set:
+        # Changed from the student side, e.g. student.enrolled_classes.add(...)
+        class_ids = pk_set
+    else:
+        # A reverse clear doesn't report which classes were affected
+        class_ids = None
+    enrollment.invalidate(class_ids)
+
+    # Class rosters feed the subject reports
+    subjects = Subject.objects.all() if class_ids is None else Subject.objects.filter(class_obj__in=class_ids)
+    summary.bump_versions(subjects.values('pk'))
+
+    # ... and the students' dashboards and calendars
+    if reverse:
+        summary.drop_student_caches([instance.pk])
+    elif pk_set:
+        summary.drop_student_caches(pk_set)
+    else:
+        dashboard.invalidate_all()
+        attendance_calendar.invalidate_all()
+
+
+@receiver(post_delete, sender=Class)
+def class_deleted(sender, instance, **kwargs):
+    enrollment.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=AcademicSession)
+@receiver(post_delete, sender=AcademicSession)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def student_caches_structure_changed(sender, raw=False, **kwargs):
+    # Session activations and class or course names show on every dashboard,
+    # and the calendar follows the active session
+    if not raw:
+        dashboard.invalidate_all()
+        attendance_calendar.invalidate_all()
+
+
+def _summary_subject(attendance):
+    # Approved attendance counts towards its lecture's subject
+    return attendance.lecture.subject_id if attendance.lecture_id else None
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_save, sender=HistoricalAttendance)
+def attendance_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        was_approved = False
+    elif hasattr(instance, '_loaded_status'):
+        was_approved = instance._loaded_status == 'approved'
+    else:
+        # Not loaded from the database, so the previous status is unknown
+        return
+    is_approved = instance.status == 'approved'
+    instance._loaded_status = instance.status
+
+    if was_approved != is_approved:
+        summary.add_approved({(_summary_subject(instance), instance.student_id): 1 if is_approved else -1})
+
+
+@receiver(post_delete, sender=Attendance)
+@receiver(post_delete, sender=HistoricalAttendance)
+def attendance_deleted(sender, instance, **kwargs):
+    if getattr(instance, '_loaded_status', instance.status) == 'approved':
+        summary.add_approved({(_summary_subject(instance), instance.student_id): -1})
+
+
+@receiver(post_save, sender=Lecture)
+@receiver(post_delete, sender=Lecture)
+def lecture_changed(sender, instance, **kwargs):
+    # Signed-token scans check against the cached date and class
+    qr_cache.forget_lecture(instance.pk)
+
+
+@receiver(post_save, sender=Lecture)
+def lecture_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        summary.add_lectures(instance.subject_id, 1)
+    else:
+        # e.g. a rescheduled date shows up in attendance trends and calendars
+        summary.bump_versions([instance.subject_id])
+        summary.drop_subject_caches([instance.subject_id])
+
+
+@receiver(pre_delete, sender=Lecture)
+def lecture_deleting(sender, instance, **kwargs):
+    # Its attendance records are kept (lecture is set to NULL) but no
+    # longer count towards the subject
+    summary.add_lectures(instance.subject_id, -1)
+    student_ids = Attendance.objects.filter(lecture=instance, status='approved').values_list('student_id', flat=True)
+    summary.add_approved({(instance.subject_id, student_id): -1 for student_id in student_ids})
@@ -0,0 +1,129 @@
+"""
+Materialized attendance totals for reports and dashboards.
+
+SubjectSummary holds each subject's lecture count and StudentSubjectSummary
+each student's approved attendance count in a subject, so report reads
+don't have to count Attendance and Lecture rows.
+
+An attendance record counts towards its lecture's subject while it is
+approved. Saves and deletes of Attendance and Lecture instances update the
+totals through teacher.signals; write paths that bypass the ORM's per-object
+saves (AttendanceManager.approve, approve_pending and set_status, bulk
+updates in views) call add_approved() themselves in the same transaction.
+If the totals ever drift (e.g. after editing rows in the database directly),
+the rebuild_attendance_summary command recomputes them.
+
+Every change also bumps SubjectSummary.version, which keys the cached
+report responses (see teacher.reports.cached_report_response), and drops
+the affected students' cached dashboards and calendars once the transaction
+commits (see student.dashboard and student.attendance_calendar).
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from student import attendance_calendar, dashboard
+
+from .models import Attendance, Lecture, StudentSubjectSummary, Subject, SubjectSummary
+
+
+def add_approved(deltas):
+    """
+    Applies {(subject_id, student_id): change} to approved counts. Rows are
+    only created for positive changes, so a decrement never resurrects the
+    summary of a subject or student that is being deleted.
+    """
+    deltas = {key: change for key, change in deltas.items() if change and key[0] is not None}
+    if not deltas:
+        return
+
+    grouped = defaultdict(list)
+    for (subject_id, student_id), change in deltas.items():
+        grouped[subject_id, change].append(student_id)
+
+    with transaction.atomic():
+        StudentSubjectSummary.objects.bulk_create([
+            StudentSubjectSummary(subject_id=subject_id, student_id=student_id)
+            for (subject_id, student_id), change in deltas.items() if change > 0
+        ], ignore_conflicts=True)
+        for (subject_id, change), student_ids in grouped.items():
+            StudentSubjectSummary.objects.filter(subject_id=subject_id, student_id__in=student_ids).update(
+                approved_count=F('approved_count') + change
+            )
+        bump_versions({subject_id for subject_id, _ in deltas})
+        student_ids = {student_id for _, student_id in deltas}
+        transaction.on_commit(lambda: drop_student_caches(student_ids))
+
+
+def add_lectures(subject_id, change):
+    with transaction.atomic():
+        if change > 0:
+            SubjectSummary.objects.bulk_create([SubjectSummary(subject_id=subject_id)], ignore_conflicts=True)
+        SubjectSummary.objects.filter(subject_id=subject_id).update(
+            lecture_count=F('lecture_count') + change,
+            version=F('version') + 1,
+        )
+        drop_subject_caches([subject_id])
+
+
+def bump_versions(subject_ids):
+    """
+    Marks the subjects' cached reports as stale. Subjects without a summary
+    row have no lectures, so their reports can't change.
+    """
+    SubjectSummary.objects.filter(subject_id__in=subject_ids).update(version=F('version') + 1)
+
+
+def drop_student_caches(student_ids):
+    """Drops the students' cached dashboards and attendance calendars."""
+    dashboard.invalidate_students(student_ids)
+    attendance_calendar.invalidate_students(student_ids)
+
+
+def drop_subject_caches(subject_ids):
+    """
+    drop_student_caches() for every student in the subjects' classes, once
+    the transaction commits. The students are looked up now, while a subject
+    that is being deleted (e.g. through its class) still has its roster.
+    """
+    student_ids = set(Subject.objects.filter(pk__in=subject_ids, class_obj__students__isnull=False).values_list(
+        'class_obj__students', flat=True
+    ))
+    transaction.on_commit(lambda: drop_student_caches(student_ids))
+
+
+def version(subject_id):
+    return SubjectSummary.objects.filter(subject_id=subject_id).values_list('version', flat=True).first() or 0
+
+
+def lecture_count(subject_id):
+    return SubjectSummary.objects.filter(subject_id=subject_id).values_list('lecture_count', flat=True).first() or 0
+
+
+def approved_count(subject_id, student_id):
+    return StudentSubjectSummary.objects.filter(
+        subject_id=subject_id, student_id=student_id
+    ).values_list('approved_count', flat=True).first() or 0
+
+
+def rebuild():
+    """Recomputes every summary from Lecture and Attendance rows. Returns the row counts."""
+    with transaction.atomic():
+        # Versions carry on from where they were, so no cached report
+        # from before the rebuild is mistaken for a current one
+        versions = dict(SubjectSummary.objects.values_list('subject_id', 'version'))
+        SubjectSummary.objects.all().delete()
+        StudentSubjectSummary.objects.all().delete()
+        lecture_counts = dict(Lecture.objects.values('subject').annotate(count=Count('id')).values_list('subject', 'count').order_by())
+        subjects = SubjectSummary.objects.bulk_create([
+            SubjectSummary(subject_id=subject_id, lecture_count=lecture_counts.get(subject_id, 0), version=versions.get(subject_id, 0) + 1)
+            for subject_id in lecture_counts.keys() | versions.keys()
+        ])
+        students = StudentSubjectSummary.objects.bulk_create([
+            StudentSubjectSummary(subject_id=row['lecture__subject'], student_id=row['student'], approved_count=row['count'])
+            for row in Attendance.objects.filter(status='approved', lecture__isnull=False)
+            .values('lecture__subject', 'student').annotate(count=Count('id')).order_by()
+        ], batch_size=1000)
+    return len(subjects), len(students)
@@ -1,3 +1,759 @@
-from django.test import TestCase
+import csv
+import io
+import uuid
+import zipfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from student.models import CustomUser
+
+from . import analytics, defaulters, dispatcher, enrollment, qr_cache, qr_images, rotation, summary, tokens
+from .models import AcademicSession, Attendance, Class, Course, Defaulter, Lecture, OutboxMessage, QRCode, StudentSubjectSummary, Subject, SubjectSummary
+from .reports import build_subject_report
+from .routing import websocket_urlpatterns
+
+
+class ReportTestCase(TestCase):
+    def setUp(self):
+        session = AcademicSession.objects.create(name='2025-2026', start_date=date(2025, 6, 1), end_date=date(2026, 5, 31))
+        course = Course.objects.create(name='B.Sc. Computer Science')
+        self.class_obj = Class.objects.create(name='FY', course=course, session=session)
+        self.teacher = CustomUser.objects.create_user(email='teacher@example.com', password='password', name='Teacher', role='Teacher')
+        self.subject = Subject.objects.create(name='Mathematics', class_obj=self.class_obj, teacher=self.teacher)
+        self.lectures = [
+            Lecture.objects.create(subject=self.subject, date=date(2025, 7, day), time=time(10))
+            for day in (1, 2, 3, 4)
+        ]
+
+    def enroll(self, count):
+        students = CustomUser.objects.bulk_create([
+            CustomUser(email=f'student{self.class_obj.students.count() + i}@example.com', name=f'Student {i}', role='Student')
+            for i in range(count)
+        ])
+        self.class_obj.students.add(*students)
+        return students
+
+    def attend(self, student, lectures, status='approved'):
+        for lecture in lectures:
+            Attendance.objects.create(student=student, lecture=lecture, subject=self.subject, date=lecture.date, status=status)
+
+
+class SubjectReportTests(ReportTestCase):
+    def test_counts_approved_attendance_per_student(self):
+        first, second = self.enroll(2)
+        self.attend(first, self.lectures[:3])
+        self.attend(first, self.lectures[3:], status='rejected')
+        self.attend(second, self.lectures[:1], status='pending')
+
+        report = build_subject_report(self.subject)
+
+        self.assertEqual(report['total_lectures'], 4)
+        self.assertEqual(report['total_students'], 2)
+        by_id = {student['student_id']: student for student in report['students']}
+        self.assertEqual(by_id[first.id]['total_attended'], 3)
+        self.assertEqual(by_id[first.id]['total_missed'], 1)
+        self.assertEqual(by_id[first.id]['attendance_percentage'], 75)
+        self.assertEqual(by_id[second.id]['total_attended'], 0)
+        self.assertEqual(report['average_attendance'], 37.5)
+
+    def test_ignores_other_subjects(self):
+        (student,) = self.enroll(1)
+        other = Subject.objects.create(name='Physics', class_obj=self.class_obj, teacher=self.teacher)
+        other_lecture = Lecture.objects.create(subject=other, date=date(2025, 7, 1), time=time(11))
+        self.attend(student, [other_lecture])
+
+        report = build_subject_report(self.subject)
+
+        self.assertEqual(report['students'][0]['total_attended'], 0)
+
+    def test_query_count_does_not_grow_with_class_size(self):
+        self.client.force_login(self.teacher)
+        urls = [
+            reverse('teacher:view_report', args=[self.subject.id]),
+            reverse('teacher:get_student_attendance_percentages') + f'?subject_id={self.subject.id}',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                counts = []
+                for size in (3, 30):
+                    for student in self.enroll(size):
+                        self.attend(student, self.lectures[:2])
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    counts.append(len(queries))
+                self.assertEqual(counts[0], counts[1])
+
+        with self.assertNumQueries(2):
+            build_subject_report(self.subject)
+
+
+class AttendanceManagerTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.student, = self.enroll(1)
+        self.lecture = self.lectures[0]
+
+    def record_scan(self):
+        return Attendance.objects.record_scan(self.student.id, self.lecture.id, self.subject.id, self.lecture.date)
+
+    def approve(self):
+        return Attendance.objects.approve(self.student.id, self.lecture.id, self.subject.id, self.lecture.date)
+
+    def test_record_scan_inserts_once(self):
+        attendance_id, created = self.record_scan()
+        self.assertTrue(created)
+        self.assertEqual(Attendance.objects.get(pk=attendance_id).status, 'pending')
+
+        self.assertEqual(self.record_scan(), (None, False))
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_record_scan_keeps_an_approved_record(self):
+        attendance_id = self.approve()
+        self.assertEqual(self.record_scan(), (None, False))
+        self.assertEqual(Attendance.objects.get(pk=attendance_id).status, 'approved')
+
+    def test_approve_inserts_or_updates_until_approved(self):
+        attendance_id = self.approve()
+        self.assertEqual(Attendance.objects.get(pk=attendance_id).status, 'approved')
+        self.assertIsNone(self.approve())
+
+        Attendance.objects.filter(pk=attendance_id).update(status='rejected', rejection_reason='Late')
+        self.assertEqual(self.approve(), attendance_id)
+        attendance = Attendance.objects.get(pk=attendance_id)
+        self.assertEqual((attendance.status, attendance.rejection_reason), ('approved', None))
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(summary.approved_count(self.subject.id, self.student.id), 2)
+
+    def test_approve_pending_query_count_does_not_grow_with_pending_rows(self):
+        self.client.force_login(self.teacher)
+        for lecture, size in zip(self.lectures, (3, 30)):
+            for student in self.enroll(size):
+                Attendance.objects.record_scan(student.id, lecture.id, self.subject.id, lecture.date)
+            # session, user, lecture, the UPDATE ... RETURNING, three summary
+            # writes and the savepoints of the two nested atomic blocks
+            with self.assertNumQueries(11):
+                self.client.post(reverse('teacher:approve_all_attendance', args=[lecture.id]))
+            self.assertFalse(Attendance.objects.filter(lecture=lecture, status='pending').exists())
+
+    def test_approve_updates_a_pending_scan(self):
+        attendance_id, _ = self.record_scan()
+        self.assertEqual(self.approve(), attendance_id)
+        self.assertEqual(Attendance.objects.get(pk=attendance_id).status, 'approved')
+
+
+class EnrollmentIndexTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        enrollment.clear()
+        self.addCleanup(enrollment.clear)
+        self.student, = self.enroll(1)
+        self.memberships = Class.students.through.objects.filter(class_id=self.class_obj.id)
+
+    def test_roster_is_cached_until_the_ttl(self):
+        enrollment.members(self.class_obj.id)
+        # Written by "another process": no m2m_changed signal reaches this one
+        self.memberships.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(enrollment.members(self.class_obj.id), {self.student.id})
+        with override_settings(ENROLLMENT_CACHE_TTL=0), self.assertNumQueries(1):
+            self.assertEqual(enrollment.members(self.class_obj.id), set())
+
+    def test_enrolling_and_unenrolling_drop_the_roster(self):
+        for change in (self.class_obj.students.remove, self.class_obj.students.add):
+            enrollment.members(self.class_obj.id)
+            generation = enrollment._generation
+            change(self.student)
+            self.assertGreater(enrollment._generation, generation)
+            self.assertNotIn(self.class_obj.id, enrollment._rosters)
+
+    def test_roster_read_during_an_invalidation_is_not_stored(self):
+        _, generation = enrollment._cached(self.class_obj.id)
+        enrollment.invalidate([self.class_obj.id])
+        enrollment._store(self.class_obj.id, frozenset(), generation, 0)
+        self.assertNotIn(self.class_obj.id, enrollment._rosters)
+
+    def test_negative_answers_are_confirmed(self):
+        other, = CustomUser.objects.bulk_create([CustomUser(email='late@example.com', name='Late', role='Student')])
+        enrollment.members(self.class_obj.id)
+        Class.students.through.objects.create(class_id=self.class_obj.id, customuser_id=other.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(enrollment.is_enrolled(self.class_obj.id, other.id))
+        self.assertNotIn(self.class_obj.id, enrollment._rosters)
+
+    def test_confirm_checks_positive_answers(self):
+        enrollment.members(self.class_obj.id)
+        self.memberships.delete()
+        self.assertTrue(enrollment.is_enrolled(self.class_obj.id, self.student.id))
+        self.assertFalse(enrollment.is_enrolled(self.class_obj.id, self.student.id, confirm=True))
+        self.assertFalse(enrollment.is_enrolled(self.class_obj.id, self.student.id))
+
+
+class QRCacheTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        qr_cache.clear()
+        self.addCleanup(qr_cache.clear)
+        self.lecture = Lecture.objects.select_related('subject__class_obj').get(pk=self.lectures[0].pk)
+
+    def qr_code(self, seconds=60):
+        return QRCode.objects.create(lecture=self.lecture, expires_at=timezone.now() + timedelta(seconds=seconds))
+
+    def test_issued_tokens_resolve_without_queries(self):
+        token, expires_at = tokens.issue_token(self.lecture)
+        with self.assertNumQueries(0):
+            active = qr_cache.lookup(token)
+        self.assertEqual((active.lecture_id, active.class_name, active.expires_at), (self.lecture.id, 'FY', expires_at))
+
+    def test_miss_falls_back_to_the_database_once(self):
+        qr_code = self.qr_code()
+        with self.assertNumQueries(1):
+            self.assertEqual(qr_cache.lookup(qr_code.qr_code_data).lecture_id, self.lecture.id)
+        with self.assertNumQueries(0):
+            qr_cache.lookup(qr_code.qr_code_data)
+        with self.assertNumQueries(0):
+            self.assertIsNone(qr_cache.lookup('not-a-uuid'))
+        with self.assertNumQueries(1):
+            self.assertIsNone(qr_cache.lookup(uuid.uuid4()))
+
+    def test_expired_tokens_are_returned_but_not_kept(self):
+        expired = self.qr_code(seconds=-1)
+        self.assertIsNotNone(qr_cache.lookup(expired.qr_code_data))
+        self.assertNotIn(str(expired.qr_code_data), qr_cache._tokens)
+
+        # An entry that expires while cached is purged by the next remember()
+        stale = self.qr_code(seconds=60)
+        qr_cache.remember(stale, lecture=self.lecture)
+        qr_cache._tokens[str(stale.qr_code_data)] = qr_cache._tokens[str(stale.qr_code_data)]._replace(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        qr_cache.remember(self.qr_code(), lecture=self.lecture)
+        self.assertNotIn(str(stale.qr_code_data), qr_cache._tokens)
+
+    def test_lectures_are_evicted_least_recently_used_first(self):
+        first, second, third = Lecture.objects.select_related('subject__class_obj').filter(
+            pk__in=[lecture.pk for lecture in self.lectures[:3]]
+        ).order_by('pk')
+        with mock.patch.object(qr_cache, 'MAX_LECTURES', 2):
+            qr_cache.remember_lecture(first)
+            qr_cache.remember_lecture(second)
+            qr_cache.lecture_info(first.id)  # now the most recently used
+            qr_cache.remember_lecture(third)
+        self.assertEqual(list(qr_cache._lectures), [first.id, third.id])
+
+    def test_clear_empties_both_caches(self):
+        qr_cache.lookup(self.qr_code().qr_code_data)
+        qr_cache.clear()
+        self.assertEqual((qr_cache._tokens, dict(qr_cache._lectures)), ({}, {}))
+
+
+@override_settings(QR_TOKEN_MODE='signed', QR_TOKEN_ROTATION_SECONDS=60, QR_TOKEN_CLOCK_SKEW_SECONDS=5)
+class SignedTokenTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        qr_cache.clear()
+        self.addCleanup(qr_cache.clear)
+        self.lecture = Lecture.objects.select_related('subject__class_obj').get(pk=self.lectures[0].pk)
+        # The start of a rotation window
+        self.window_start = datetime.fromtimestamp(tokens.current_window()[0] * 60, tz=dt_timezone.utc)
+
+    def resolve_at(self, token, seconds):
+        with mock.patch.object(tokens.timezone, 'now', return_value=self.window_start + timedelta(seconds=seconds)):
+            return tokens.resolve_token(token)
+
+    def test_sign_and_verify(self):
+        token, expires_at = tokens.sign_token(self.lecture.id, now=self.window_start)
+        self.assertEqual(expires_at, self.window_start + timedelta(seconds=60))
+        self.assertEqual(tokens.verify_token(token), (self.lecture.id, tokens.current_window(self.window_start)[0], expires_at))
+
+        issued, _ = tokens.issue_token(self.lecture)
+        self.assertEqual(QRCode.objects.count(), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.resolve_token(issued).lecture_id, self.lecture.id)
+
+    def test_expiry_allows_for_clock_skew(self):
+        token, expires_at = tokens.sign_token(self.lecture.id, now=self.window_start)
+        # Callers reject the token once now passes expires_at
+        self.assertEqual(self.resolve_at(token, 62).expires_at, expires_at + timedelta(seconds=5))
+        self.assertLess(self.resolve_at(token, 70).expires_at, self.window_start + timedelta(seconds=70))
+
+    def test_future_window_is_rejected_beyond_clock_skew(self):
+        token, _ = tokens.sign_token(self.lecture.id, now=self.window_start + timedelta(seconds=60))
+        self.assertIsNone(self.resolve_at(token, 30))
+        self.assertIsNotNone(self.resolve_at(token, 57))
+
+    def test_tampered_tokens_are_rejected(self):
+        token, _ = tokens.sign_token(self.lecture.id)
+        payload, signature = token.rsplit(':', 1)
+        other_lecture = tokens.sign_token(self.lectures[1].id)[0].rsplit(':', 1)[0]
+        for tampered in (f'{payload}:{signature[:-1]}x', f'{other_lecture}:{signature}', 'a:b:c'):
+            with self.subTest(token=tampered):
+                self.assertIsNone(tokens.verify_token(tampered))
+                self.assertIsNone(tokens.resolve_token(tampered))
+
+    def test_lecture_changes_reach_the_cache(self):
+        token, _ = tokens.issue_token(self.lecture)
+        self.lecture.date = date(2025, 7, 10)
+        self.lecture.save()
+        self.assertEqual(tokens.resolve_token(token).lecture_date, date(2025, 7, 10))
+
+        self.lecture.delete()
+        self.assertIsNone(tokens.resolve_token(token))
+
+
+class QRRotationTests(ReportTestCase):
+    def test_workers_agree_on_a_windows_token(self):
+        lecture = self.lectures[0]
+        token, expires_at = tokens.issue_token(lecture)
+        self.assertEqual(expires_at.timestamp(), tokens.current_window()[1])
+        self.assertEqual(tokens.issue_token(lecture)[0], token)
+
+        # A worker that missed the row while another was inserting it
+        with mock.patch.object(QRCode.objects, 'filter', return_value=QRCode.objects.none()):
+            self.assertEqual(tokens.issue_token(lecture), (token, expires_at))
+        self.assertEqual(QRCode.objects.count(), 1)
+
+    async def test_watch_survives_a_failed_issue(self):
+        scheduler = rotation.RotationScheduler()
+        lecture = self.lectures[0]
+        with mock.patch.object(tokens, 'issue_token', side_effect=RuntimeError('database is locked')), \
+                self.assertLogs(rotation.logger, 'ERROR'):
+            self.assertIsNone(await scheduler.watch(lecture))
+        self.assertEqual(scheduler.lectures[lecture.id][2], 1)
+
+        scheduler.unwatch(lecture.id)
+        self.assertEqual(scheduler.lectures, {})
+        scheduler.task.cancel()
+
+
+class LectureQRImageTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lecture = self.lectures[0]
+        self.token, _ = tokens.issue_token(self.lecture)
+        self.client.force_login(self.teacher)
+
+    def get_image(self, fmt, **headers):
+        url = reverse('teacher:lecture_qr_image', args=[self.lecture.id, fmt])
+        return self.client.get(url, {'token': self.token}, headers=headers)
+
+    def test_images_are_cached_until_the_token_expires(self):
+        for fmt, signature in (('png', b'\x89PNG'), ('svg', b'<svg')):
+            with self.subTest(fmt=fmt):
+                response = self.get_image(fmt)
+                remaining = tokens.resolve_token(self.token).expires_at - timezone.now()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], qr_images.CONTENT_TYPES[fmt])
+                self.assertIn(signature, response.content[:100])
+                self.assertEqual(response['ETag'], qr_images.etag(self.token, fmt))
+                self.assertIn('private', response['Cache-Control'])
+                max_age = int(response['Cache-Control'].split('max-age=')[1].split(',')[0])
+                self.assertAlmostEqual(max_age, remaining.total_seconds(), delta=1)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = qr_images.etag(self.token, 'svg')
+        response = self.get_image('svg', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.get_image('svg', if_none_match=qr_images.etag(self.token, 'png')).status_code, 200)
+
+    def test_other_teachers_are_forbidden(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='password', name='Other', role='Teacher')
+        self.client.force_login(other)
+        self.assertEqual(self.get_image('svg').status_code, 403)
+
+
+@override_settings(ATTENDANCE_WS_BATCH_WINDOW_MS=100)
+class AttendanceConsumerTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lecture = self.lectures[0]
+        self.group = f'attendance_{self.lecture.id}'
+        # The feed, not the QR rotation, is under test
+        patcher = mock.patch.multiple(rotation.scheduler, watch=mock.AsyncMock(return_value=None), unwatch=mock.DEFAULT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/attendance/{self.lecture.id}/')
+        communicator.scope['user'] = self.teacher
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def update(self, attendance_id):
+        await get_channel_layer().group_send(self.group, {'type': 'attendance.update', 'data': {'attendance_id': attendance_id}})
+
+    async def test_updates_within_a_window_share_a_frame(self):
+        communicator = await self.connect()
+        for attendance_id in (1, 2, 3):
+            await self.update(attendance_id)
+        frame = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(frame, {'updates': [{'attendance_id': 1}, {'attendance_id': 2}, {'attendance_id': 3}]})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        await communicator.disconnect()
+
+    async def test_lone_update_is_sent_when_the_window_closes(self):
+        communicator = await self.connect()
+        await self.update(1)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+        self.assertEqual(await communicator.receive_json_from(timeout=1), {'updates': [{'attendance_id': 1}]})
+        await communicator.disconnect()
+
+
+class PendingAttendanceCursorTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lecture = self.lectures[0]
+        self.changed_at = datetime(2025, 7, 1, 10, 5, tzinfo=dt_timezone.utc)
+        for minutes, student in enumerate(self.enroll(2)):
+            Attendance.objects.record_scan(student.id, self.lecture.id, self.subject.id, self.lecture.date)
+            Attendance.objects.filter(student=student).update(updated_at=self.changed_at + timedelta(minutes=minutes))
+        self.newer = Attendance.objects.get(updated_at__gt=self.changed_at)
+        self.client.force_login(self.teacher)
+
+    def changes_since(self, cursor):
+        return self.client.get(reverse('teacher:get_pending_attendance', args=[self.lecture.id]), {'since': cursor})
+
+    def test_cursor_returns_only_newer_changes(self):
+        for cursor in ('2025-07-01T10:05:30+00:00', '2025-07-01T10:05:30'):
+            with self.subTest(cursor=cursor):
+                response = self.changes_since(cursor)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([change['attendance_id'] for change in response.json()['changes']], [self.newer.id])
+                self.assertEqual(response.json()['cursor'], self.newer.updated_at.isoformat())
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('yesterday', '2020-13-45T00:00:00'):
+            with self.subTest(cursor=cursor):
+                response = self.changes_since(cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor.'})
+
+
+class BulkUpdateAttendanceTests(ReportTestCase):
+    def test_malformed_changes_are_rejected_per_item(self):
+        student, = self.enroll(1)
+        attendance_id, _ = Attendance.objects.record_scan(student.id, self.lectures[0].id, self.subject.id, self.lectures[0].date)
+        self.client.force_login(self.teacher)
+
+        response = self.client.post(reverse('teacher:bulk_update_attendance'), {'changes': [
+            {'id': True, 'action': 'approve'},
+            {'id': attendance_id, 'action': 'reject', 'reason': 123},
+        ]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['message'] for result in response.json()['results']], [
+            'Invalid attendance id.', 'Invalid rejection reason.',
+        ])
+        self.assertEqual(Attendance.objects.get(pk=attendance_id).status, 'pending')
+
+
+class AttendanceSummaryTests(ReportTestCase):
+    def snapshot(self):
+        return (
+            sorted(SubjectSummary.objects.values_list('subject_id', 'lecture_count')),
+            sorted(StudentSubjectSummary.objects.filter(approved_count__gt=0).values_list('subject_id', 'student_id', 'approved_count')),
+        )
+
+    def assertSummaryConsistent(self):
+        maintained = self.snapshot()
+        summary.rebuild()
+        self.assertEqual(maintained, self.snapshot())
+
+    def test_summaries_follow_every_write_path(self):
+        students = self.enroll(4)
+        lecture = self.lectures[0]
+        self.client.force_login(self.teacher)
+
+        for student in students:
+            Attendance.objects.record_scan(student.id, lecture.id, self.subject.id, lecture.date)
+        self.client.post(reverse('teacher:approve_all_attendance', args=[lecture.id]))
+        self.assertEqual(summary.approved_count(self.subject.id, students[0].id), 1)
+        self.assertSummaryConsistent()
+
+        attendance = Attendance.objects.get(student=students[0], lecture=lecture)
+        self.client.post(reverse('teacher:reject_attendance', args=[attendance.id]), '{}', content_type='application/json')
+        self.client.post(reverse('teacher:reject_attendance', args=[attendance.id]), '{}', content_type='application/json')
+        self.assertEqual(summary.approved_count(self.subject.id, students[0].id), 0)
+        self.assertSummaryConsistent()
+
+        # A double click on approve counts once, as does a double reject
+        for _ in range(2):
+            self.client.post(reverse('teacher:approve_attendance', args=[attendance.id]))
+        self.assertEqual(summary.approved_count(self.subject.id, students[0].id), 1)
+        for _ in range(2):
+            self.client.post(reverse('teacher:reject_attendance', args=[attendance.id]), '{"reason": "Late"}', content_type='application/json')
+        self.assertEqual(summary.approved_count(self.subject.id, students[0].id), 0)
+        self.assertEqual(Attendance.objects.get(pk=attendance.id).rejection_reason, 'Late')
+        self.assertSummaryConsistent()
+
+        Attendance.objects.approve(students[0].id, lecture.id, self.subject.id, lecture.date)
+        Attendance.objects.approve(students[0].id, self.lectures[1].id, self.subject.id, self.lectures[1].date)
+        Attendance.objects.approve(students[0].id, self.lectures[1].id, self.subject.id, self.lectures[1].date)
+        self.assertEqual(summary.approved_count(self.subject.id, students[0].id), 2)
+        self.assertSummaryConsistent()
+
+        other = Attendance.objects.get(student=students[1], lecture=lecture)
+        self.client.post(reverse('teacher:bulk_update_attendance'), {'changes': [
+            {'id': attendance.id, 'action': 'approve'},
+            {'id': other.id, 'action': 'reject'},
+        ]}, content_type='application/json')
+        self.assertSummaryConsistent()
+
+        Attendance.objects.get(student=students[2], lecture=lecture).delete()
+        self.lectures[1].delete()
+        Lecture.objects.create(subject=self.subject, date=date(2025, 7, 5), time=time(10))
+        self.assertEqual(summary.lecture_count(self.subject.id), 4)
+        self.assertSummaryConsistent()
+
+
+class CachedReportTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse('teacher:get_teacher_subject_attendance_data') + f'?subject_id={self.subject.id}'
+        self.client.force_login(self.teacher)
+
+    def test_unchanged_report_is_revalidated_with_304(self):
+        student, = self.enroll(1)
+        self.attend(student, self.lectures[:2])
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'present': 2, 'absent': 2})
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_attendance_change_invalidates_cached_report(self):
+        student, = self.enroll(1)
+        etag = self.client.get(self.url)['ETag']
+
+        self.attend(student, self.lectures[:1])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), {'present': 1, 'absent': 3})
+
+
+    def test_student_reports_are_cached_and_invalidated(self):
+        student, = self.enroll(1)
+        self.attend(student, self.lectures[:1])
+        self.client.force_login(student)
+        urls = {
+            reverse('student:get_student_subject_attendance_data'): {'attended': 1, 'missed': 3},
+            reverse('student:get_student_attendance_trend'): {
+                'labels': ['2025-07-01', '2025-07-02', '2025-07-03', '2025-07-04'], 'data': [1, 0, 0, 0],
+            },
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, {'subject_id': self.subject.id})
+                self.assertEqual(response.json(), expected)
+                etag = response['ETag']
+                response = self.client.get(url, {'subject_id': self.subject.id}, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+        self.attend(student, self.lectures[1:2])
+        response = self.client.get(reverse('student:get_student_subject_attendance_data'), {'subject_id': self.subject.id})
+        self.assertEqual(response.json(), {'attended': 2, 'missed': 2})
+
+class AttendanceExportTests(ReportTestCase):
+    def test_csv_matrix_matches_attendance(self):
+        first, second = self.enroll(2)
+        self.attend(first, self.lectures[:3])
+        self.attend(second, self.lectures[1:2], status='pending')
+        self.client.force_login(self.teacher)
+
+        response = self.client.get(reverse('teacher:export_attendance', args=['subject', self.subject.id, 'csv']))
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[1][:3], ['Student', 'Email', 'Roll No.'])
+        self.assertEqual(rows[2][3:], ['P', 'P', 'P', 'A', '3', '4', '75'])
+        self.assertEqual(rows[3][3:], ['A', 'Pending', 'A', 'A', '0', '4', '0'])
+
+    def test_xlsx_has_a_sheet_per_subject(self):
+        self.enroll(1)
+        Subject.objects.create(name='Physics', class_obj=self.class_obj, teacher=self.teacher)
+        self.client.force_login(self.teacher)
+
+        response = self.client.get(reverse('teacher:export_attendance', args=['class', self.class_obj.id, 'xlsx']))
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            self.assertIn('xl/worksheets/sheet2.xml', workbook.namelist())
+            self.assertIn(b'name="Physics"', workbook.read('xl/workbook.xml'))
+
+    def test_other_teachers_cannot_export(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='password', name='Other', role='Teacher')
+        self.client.force_login(other)
+        response = self.client.get(reverse('teacher:export_attendance', args=['subject', self.subject.id, 'csv']))
+        self.assertEqual(response.status_code, 403)
+
+
+class AnalyticsTests(ReportTestCase):
+    def test_matrix_statistics(self):
+        first, second = self.enroll(2)
+        Lecture.objects.filter(pk=self.lectures[3].pk).update(date=date(2025, 7, 8))  # the next week
+        self.attend(first, [self.lectures[0], self.lectures[3]])
+        self.attend(second, self.lectures[:3])
+        self.attend(second, self.lectures[3:], status='rejected')
+
+        matrix = analytics.load_matrix(self.class_obj)
+        self.assertEqual(matrix.present.tolist(), [[True, False, False, True], [True, True, True, False]])
+
+        result = analytics.analyse(matrix)
+        self.assertEqual([student['percentage'] for student in result['students']], [50, 75])
+        self.assertEqual([student['longest_absence_streak'] for student in result['students']], [2, 1])
+        self.assertEqual([lecture['turnout'] for lecture in result['lectures']], [100, 50, 50, 50])
+        self.assertEqual([(week['start'], week['attendance'], week['change']) for week in result['weeks']], [
+            ('2025-06-30', 66.7, None), ('2025-07-07', 50, -16.7),
+        ])
+        self.assertEqual([student['trend'] for student in result['students']], [66.7, -100])
+
+    def test_endpoint_is_limited_to_the_subjects_teacher(self):
+        self.enroll(1)
+        url = reverse('teacher:get_subject_analytics') + f'?subject_id={self.subject.id}'
+        other = CustomUser.objects.create_user(email='other@example.com', password='password', name='Other', role='Teacher')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get(url).json()['total_lectures'], 4)
+
+
+class DefaulterTests(ReportTestCase):
+    def defaulters(self):
+        return sorted(Defaulter.objects.values_list('student_id', 'attended', 'total_lectures'))
+
+    def test_refresh_lists_students_below_threshold(self):
+        first, second, third = self.enroll(3)
+        self.attend(first, self.lectures[:2])
+        self.attend(second, self.lectures[:3])
+
+        self.assertEqual(defaulters.refresh(threshold=75), (1, 2))
+        self.assertEqual(self.defaulters(), [(first.id, 2, 4), (third.id, 0, 4)])
+
+        # Only changed subjects are rechecked incrementally
+        other = Subject.objects.create(name='Physics', class_obj=self.class_obj, teacher=self.teacher)
+        Lecture.objects.create(subject=other, date=date(2025, 7, 1), time=time(11))
+        self.assertEqual(defaulters.refresh(threshold=75, incremental=True), (1, 3))
+        self.assertEqual(defaulters.refresh(threshold=75, incremental=True), (0, 0))
+
+        self.attend(first, self.lectures[2:3])
+        self.assertEqual(defaulters.refresh(threshold=75, incremental=True), (1, 1))
+        self.assertEqual(Defaulter.objects.filter(subject=self.subject).count(), 1)
+
+        # So is every subject when the threshold changes
+        self.assertEqual(defaulters.refresh(threshold=50, incremental=True), (2, 4))
+
+    def test_endpoint_lists_the_teachers_subjects(self):
+        student, = self.enroll(1)
+        defaulters.refresh()
+        self.client.force_login(self.teacher)
+        rows = self.client.get(reverse('teacher:get_defaulters')).json()['defaulters']
+        self.assertEqual([(row['student_id'], row['percentage']) for row in rows], [(student.id, 0)])
+
+
+class OutboxClaimTests(TestCase):
+    def test_each_message_is_leased_to_one_worker(self):
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(kind='group', recipient=f'student_{i}', payload={'type': 'attendance_status_update', 'message': {}})
+            for i in range(3)
+        ])
+        first = dispatcher.claim(batch_size=2, lease_seconds=60, max_attempts=5)
+        self.assertEqual([message.attempts for message in first], [1, 1])
+        second = dispatcher.claim(batch_size=2, lease_seconds=60, max_attempts=5)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(dispatcher.claim(batch_size=2, lease_seconds=60, max_attempts=5), [])
+
+    def test_a_worker_that_read_stale_candidates_leases_nothing(self):
+        for returning in (True, False):
+            with self.subTest(returning=returning), \
+                    mock.patch.object(dispatcher, '_supports_update_returning', return_value=returning):
+                message = OutboxMessage.objects.create(kind='email', recipient='student@example.com', payload={})
+                now = timezone.now()
+                lease_until = now + timedelta(seconds=60)
+                # Both workers read the message as due before either leased it
+                self.assertEqual(dispatcher._lease([message.pk], now, lease_until, 5), [message.pk])
+                self.assertEqual(dispatcher._lease([message.pk], now, lease_until, 5), [])
+                self.assertEqual(OutboxMessage.objects.get(pk=message.pk).attempts, 1)
+
+    def test_update_returning_is_not_assumed_from_insert_returning(self):
+        # MariaDB can return columns from an INSERT, but not from an UPDATE
+        with mock.patch.object(connection, 'vendor', 'mysql'), \
+                mock.patch.object(connection.features, 'can_return_columns_from_insert', True):
+            self.assertFalse(dispatcher._supports_update_returning())
+
+
+class OutboxDispatchTests(TestCase):
+    config = {**dispatcher.DEFAULTS, 'MAX_ATTEMPTS': 3, 'RETRY_BACKOFF_SECONDS': 5, 'RETENTION_HOURS': 24}
+
+    def queue(self, recipient, payload, kind='group'):
+        return OutboxMessage.objects.create(kind=kind, recipient=recipient, payload=payload)
+
+    def test_messages_are_coalesced_per_recipient(self):
+        messages = [
+            self.queue('attendance_1', {'type': 'attendance_update', 'data': {'attendance_id': 1}}),
+            self.queue('student_1', {'type': 'attendance_status_update', 'message': 'Approved'}),
+            self.queue('attendance_1', {'type': 'attendance_batch', 'data': [{'attendance_id': 2}, {'attendance_id': 3}]}),
+            self.queue('student_1', {'type': 'attendance_status_update', 'message': 'Rejected'}),
+            self.queue('student_2', {'type': 'attendance_status_update', 'message': 'Approved'}),
+            self.queue('attendance_1', {'type': 'qr_rotate', 'data': {}}),
+        ]
+        deliveries = dispatcher.coalesce(messages)
+        self.assertEqual([(group, event) for group, event, _ in deliveries], [
+            ('attendance_1', {'type': 'attendance_batch', 'data': [{'attendance_id': 1}, {'attendance_id': 2}, {'attendance_id': 3}]}),
+            ('student_1', {'type': 'attendance_status_batch', 'messages': ['Approved', 'Rejected']}),
+            ('student_2', {'type': 'attendance_status_update', 'message': 'Approved'}),
+            ('attendance_1', {'type': 'qr_rotate', 'data': {}}),
+        ])
+        self.assertEqual([len(batch) for _, _, batch in deliveries], [2, 2, 1, 1])
+
+    def test_failed_deliveries_back_off_until_out_of_attempts(self):
+        message = self.queue('student_1', {'type': 'attendance_status_update', 'message': 'Approved'})
+        channel_layer = mock.Mock(group_send=mock.AsyncMock(side_effect=RuntimeError('layer down')))
+        now = timezone.now()
+        with mock.patch.object(dispatcher, 'get_channel_layer', return_value=channel_layer), \
+                self.assertLogs(dispatcher.logger, 'WARNING'):
+            for attempt, backoff in ((1, 5), (2, 10), (3, 20)):
+                with mock.patch.object(dispatcher.timezone, 'now', return_value=now):
+                    self.assertEqual(dispatcher.dispatch_batch(self.config)['failed'], 1)
+                message.refresh_from_db()
+                self.assertEqual(message.attempts, attempt)
+                self.assertEqual(message.available_at, now + timedelta(seconds=backoff))
+                self.assertEqual(message.last_error, 'layer down')
+                now = message.available_at
+
+            with mock.patch.object(dispatcher.timezone, 'now', return_value=now):
+                self.assertEqual(dispatcher.dispatch_batch(self.config)['claimed'], 0)
+                self.assertEqual(dispatcher.stats(self.config)['dead'], 1)
+
+    def test_emails_are_sent_and_marked_delivered(self):
+        message = self.queue('student@example.com', {
+            'subject': 'Attendance', 'body': 'You were marked present.', 'from_email': 'ams@example.com',
+        }, kind='email')
+        result = dispatcher.dispatch_batch(self.config)
+        self.assertEqual((result['claimed'], result['delivered'], result['failed']), (1, 1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual((mail.outbox[0].to, mail.outbox[0].subject), (['student@example.com'], 'Attendance'))
+        message.refresh_from_db()
+        self.assertIsNotNone(message.delivered_at)
+
+    def test_prune_deletes_old_delivered_messages(self):
+        now = timezone.now()
+        old, recent, pending = (self.queue(f'student_{i}', {}) for i in range(3))
+        OutboxMessage.objects.filter(pk=old.pk).update(delivered_at=now - timedelta(hours=25))
+        OutboxMessage.objects.filter(pk=recent.pk).update(delivered_at=now - timedelta(hours=1))
+        self.assertEqual(dispatcher.prune(self.config), 1)
+        self.assertQuerySetEqual(OutboxMessage.objects.order_by('pk'), [recent, pending])
@@ -0,0 +1,155 @@
+"""
+Issuing and resolving the tokens shown in a lecture's QR code.
+
+Two modes are supported, chosen with QR_TOKEN_MODE:
+
+* 'uuid' stores each token as a QRCode row that lives until the end of the
+  current rotation window. A lecture has at most one row per window, so
+  workers issuing at the same moment agree on the token. Scans are resolved
+  through teacher.qr_cache.
+* 'signed' encodes (lecture_id, window_index, expiry) in the token itself and
+  signs it with SECRET_KEY. Issuing writes nothing and validating reads
+  nothing; the token for a lecture changes every QR_TOKEN_ROTATION_SECONDS.
+  Scans are accepted up to QR_TOKEN_CLOCK_SKEW_SECONDS outside the window to
+  absorb clock drift between the teacher's and the students' servers.
+"""
+
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import qr_cache
+from .models import QRCode
+
+SIGNED_TOKEN_SALT = 'teacher.qr-token'
+
+SignedToken = namedtuple('SignedToken', ['lecture_id', 'window', 'expires_at'])
+
+
+def token_mode():
+    return getattr(settings, 'QR_TOKEN_MODE', 'uuid')
+
+
+def rotation_seconds():
+    return getattr(settings, 'QR_TOKEN_ROTATION_SECONDS', 60)
+
+
+def clock_skew_seconds():
+    return getattr(settings, 'QR_TOKEN_CLOCK_SKEW_SECONDS', 5)
+
+
+def _signer():
+    return signing.Signer(salt=SIGNED_TOKEN_SALT)
+
+
+def current_window(now=None):
+    """Returns (window_index, expiry timestamp) of the rotation window containing now."""
+    now = now or timezone.now()
+    period = rotation_seconds()
+    window = int(now.timestamp()) // period
+    return window, (window + 1) * period
+
+
+def sign_token(lecture_id, now=None):
+    """Returns the signed token for a lecture's current window."""
+    window, expiry = current_window(now)
+    payload = '.'.join(signing.b62_encode(value) for value in (lecture_id, window, expiry))
+    token = _signer().sign(payload)
+    return token, datetime.fromtimestamp(expiry, tz=dt_timezone.utc)
+
+
+def verify_token(token):
+    """
+    Checks a signed token's signature and returns a SignedToken, or None if
+    it is malformed or was not issued by this server. Expiry is not checked.
+    """
+    try:
+        payload = _signer().unsign(token)
+        lecture_id, window, expiry = (signing.b62_decode(value) for value in payload.split('.'))
+    except (signing.BadSignature, ValueError):
+        return None
+    return SignedToken(lecture_id, window, datetime.fromtimestamp(expiry, tz=dt_timezone.utc))
+
+
+def issue_token(lecture):
+    """
+    Returns (token, expires_at) for the QR code currently shown for a
+    lecture. The lecture should have subject__class_obj loaded.
+    """
+    if token_mode() == 'signed':
+        qr_cache.remember_lecture(lecture)
+        return sign_token(lecture.id)
+
+    # Reuse the lecture's active QR code if there is one
+    qr_code = QRCode.objects.filter(
+        lecture=lecture,
+        expires_at__gt=timezone.now()
+    ).first()
+
+    if qr_code is None:
+        expires_at = datetime.fromtimestamp(current_window()[1], tz=dt_timezone.utc)
+        try:
+            with transaction.atomic():
+                qr_code = QRCode.objects.create(
+                    lecture=lecture,
+                    qr_code_data=str(uuid.uuid4()),
+                    expires_at=expires_at
+                )
+        except IntegrityError:
+            # Another worker issued this window's token first; show the same one
+            qr_code = QRCode.objects.get(lecture=lecture, expires_at=expires_at)
+
+    # Warm the scan-path cache so students' scans resolve without a query
+    qr_cache.remember(qr_code, lecture=lecture)
+    return str(qr_code.qr_code_data), qr_code.expires_at
+
+
+def _check_signed(qr_code_data):
+    """Verifies a signed token and rejects ones whose window hasn't started."""
+    signed = verify_token(qr_code_data)
+    if signed is None:
+        return None
+
+    window_start = signed.expires_at - timedelta(seconds=rotation_seconds())
+    if window_start - timedelta(seconds=clock_skew_seconds()) > timezone.now():
+        return None
+    return signed
+
+
+def _active_token(info, signed):
+    if info is None:
+        return None
+    return qr_cache.ActiveToken(*info, expires_at=signed.expires_at + timedelta(seconds=clock_skew_seconds()))
+
+
+def resolve_token(qr_code_data):
+    """
+    Resolves scanned QR data to a qr_cache.ActiveToken, or None if it is not
+    a valid token. Expired tokens are returned; callers check expires_at.
+    UUID tokens are always accepted so codes issued before a switch to
+    signed mode keep working until they expire.
+    """
+    qr_code_data = str(qr_code_data)
+    if ':' not in qr_code_data:
+        return qr_cache.lookup(qr_code_data)
+
+    signed = _check_signed(qr_code_data)
+    if signed is None:
+        return None
+    return _active_token(qr_cache.lecture_info(signed.lecture_id), signed)
+
+
+async def aresolve_token(qr_code_data):
+    qr_code_data = str(qr_code_data)
+    if ':' not in qr_code_data:
+        return await qr_cache.alookup(qr_code_data)
+
+    signed = _check_signed(qr_code_data)
+    if signed is None:
+        return None
+    return _active_token(await qr_cache.alecture_info(signed.lecture_id), signed)
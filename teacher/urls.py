@@ -16,16 +16,21 @@ urlpatterns = [
     path('subject/<int:subject_id>/lectures/', views.view_lectures, name='view_lectures'),
     path('lectures/prune/', views.prune_lectures_view, name='prune_lectures'),
     path('lecture/<int:lecture_id>/generate-qr/', views.generate_qr_code, name='generate_qr_code'),
+    path('lecture/<int:lecture_id>/qr.<str:fmt>', views.lecture_qr_image, name='lecture_qr_image'),
     path('lecture/<int:lecture_id>/search-students/', views.search_students, name='search_students'),
     path('lecture/<int:lecture_id>/mark-manual-attendance/', views.manual_mark_attendance, name='manual_mark_attendance'),
     path('lecture/<int:lecture_id>/pending-attendance/', views.get_pending_attendance, name='get_pending_attendance'),
     path('attendance/<int:attendance_id>/approve/', views.approve_attendance, name='approve_attendance'),
     path('attendance/<int:attendance_id>/reject/', views.reject_attendance, name='reject_attendance'),
+    path('attendance/bulk-update/', views.bulk_update_attendance, name='bulk_update_attendance'),
     path('lecture/<int:lecture_id>/approve-all/', views.approve_all_attendance, name='approve_all_attendance'),
     path('subject/<int:subject_id>/report/', views.view_report, name='view_report'),
+    path('export/<str:scope>/<int:object_id>.<str:fmt>', views.export_attendance, name='export_attendance'),
     path('profile/', views.profile, name='profile'),
     path('get-classes/<int:course_id>/', views.get_classes, name='get_classes'),
     path('reports/', views.reports_view, name='reports'),
     path('get-teacher-subject-attendance-data/', views.get_teacher_subject_attendance_data, name='get_teacher_subject_attendance_data'),
+    path('get-defaulters/', views.get_defaulters, name='get_defaulters'),
+    path('get-subject-analytics/', views.get_subject_analytics, name='get_subject_analytics'),
     path('get-student-attendance-percentages/', views.get_student_attendance_percentages, name='get_student_attendance_percentages'),
 ]
\ No newline at end of file
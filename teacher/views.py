@@ -1,20 +1,21 @@
-import uuid
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from datetime import timedelta
-from .models import Course, Class, QRCode, Attendance, Lecture, Subject, AcademicSession
+from .models import Course, Class, Attendance, Defaulter, Lecture, Subject, AcademicSession
 from student.models import CustomUser
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
 from django.views.decorators.http import require_POST
-from django.db.models import Prefetch, Q
+from django.db import transaction
+from django.db.models import Case, Prefetch, Q, Sum, Value, When
 from django.contrib.auth.hashers import make_password
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 import json
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from . import analytics, enrollment, exports, notifications, qr_images, reports, summary, tokens
 
 @login_required
 def teacher_dashboard(request):
@@ -99,7 +100,7 @@ def create_subject_view(request, class_id):
 
 @login_required
 def generate_qr_code(request, lecture_id):
-    lecture = get_object_or_404(Lecture, pk=lecture_id)
+    lecture = get_object_or_404(Lecture.objects.select_related('subject__class_obj'), pk=lecture_id)
     
     # Permission check: ensure the teacher teaches the subject associated with this lecture
     if request.user.role != 'Teacher' or lecture.subject.teacher != request.user:
@@ -110,25 +111,11 @@ def generate_qr_code(request, lecture_id):
         messages.error(request, "You cannot generate a QR code for a past lecture.")
         return redirect('teacher:view_lectures', subject_id=lecture.subject.id)
 
-    # Check for an existing active QR code for this lecture
-    active_qr_code = QRCode.objects.filter(
-        lecture=lecture,
-        expires_at__gt=timezone.now()
-    ).first()
+    qr_code_data, expires_at = tokens.issue_token(lecture)
 
-    if active_qr_code:
-        qr_code = active_qr_code
-    else:
-        # If no active QR code, create a new one
-        expires_at = timezone.now() + timedelta(minutes=1)
-        # Explicitly generate a UUID for qr_code_data
-        new_qr_code_data = str(uuid.uuid4()) 
-        qr_code = QRCode.objects.create(
-            lecture=lecture, 
-            qr_code_data=new_qr_code_data, # Assign the generated UUID
-            expires_at=expires_at
-        )
-    
+    # The page renders this snapshot, then follows changes over the
+    # lecture's WebSocket, catching up from this cursor after reconnects
+    pending_cursor = timezone.now().isoformat()
     pending_attendances = Attendance.objects.filter(
         lecture=lecture,
         status='pending'
@@ -136,39 +123,59 @@ def generate_qr_code(request, lecture_id):
 
     context = {
         'lecture': lecture,
-        'qr_code_data': str(qr_code.qr_code_data),
-        'expires_at': qr_code.expires_at.isoformat(),
+        'qr_code_data': qr_code_data,
+        'expires_at': expires_at.isoformat(),
         'pending_students': pending_attendances,
+        'pending_cursor': pending_cursor,
     }
     return render(request, 'teacher/generate_qr.html', context)
 
+@login_required
+def lecture_qr_image(request, lecture_id, fmt):
+    """Serves the QR code image for one of a lecture's current tokens."""
+    if fmt not in qr_images.CONTENT_TYPES:
+        raise Http404
+
+    if request.user.role != 'Teacher' or not Lecture.objects.filter(pk=lecture_id, subject__teacher=request.user).exists():
+        return HttpResponseForbidden("You are not authorized to view this QR code.")
+
+    token = request.GET.get('token', '')
+    active_token = tokens.resolve_token(token) if token else None
+    if active_token is None or active_token.lecture_id != lecture_id:
+        raise Http404
+    max_age = int((active_token.expires_at - timezone.now()).total_seconds())
+    if max_age <= 0:
+        raise Http404
+
+    # A token's image never changes, so browsers may keep it until it expires
+    etag = qr_images.etag(token, fmt)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(qr_images.render(token, fmt), content_type=qr_images.CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
 @login_required
 def view_report(request, subject_id): # Changed from class_id
-    subject = get_object_or_404(Subject, pk=subject_id)
+    subject = get_object_or_404(Subject.objects.select_related('class_obj__course'), pk=subject_id)
     
     # Permission check: ensure the teacher teaches this subject
-    if request.user.role != 'Teacher' or subject.teacher != request.user:
+    if request.user.role != 'Teacher' or subject.teacher_id != request.user.id:
         return HttpResponseForbidden("You are not authorized to view this report for this subject.")
 
-    students = subject.class_obj.students.all() # Students enrolled in the class of the subject
-    total_students = students.count()
-    total_lectures = Lecture.objects.filter(subject=subject).count() # Filter by subject
-
-    student_reports = []
-    total_attendance_sum = 0
-
-    for student in students:
-        attended_lectures = Attendance.objects.filter(lecture__subject=subject, student=student, status='approved').count() # Filter by subject
-        attendance_percentage = (attended_lectures / total_lectures) * 100 if total_lectures > 0 else 0
-        total_attendance_sum += attendance_percentage
-        student_reports.append({
-            'student_name': student.name,
-            'total_attended': attended_lectures,
-            'total_missed': total_lectures - attended_lectures,
-            'attendance_percentage': round(attendance_percentage)
-        })
-
-    average_attendance = round(total_attendance_sum / total_students) if total_students > 0 else 0
+    report = reports.build_subject_report(subject)
+    student_reports = [
+        {
+            'student_name': student['student_name'],
+            'total_attended': student['total_attended'],
+            'total_missed': student['total_missed'],
+            'attendance_percentage': round(student['attendance_percentage'])
+        }
+        for student in report['students']
+    ]
+    total_students = report['total_students']
+    average_attendance = round(report['average_attendance'])
 
     context = {
         'course': subject.class_obj.course, # Use subject's class's course
@@ -209,6 +216,39 @@ def teacher_register_view(request):
     courses = Course.objects.all()
     return render(request, 'teacher/register.html', {'courses': courses})
 
+EXPORT_SCOPES = {
+    'subject': Subject,
+    'class': Class,
+    'session': AcademicSession,
+}
+
+
+@login_required
+def export_attendance(request, scope, object_id, fmt):
+    """
+    Streams the attendance matrix of a subject, or of every subject of a
+    class or session, as CSV or XLSX. Teachers get the subjects they teach,
+    staff every subject.
+    """
+    if scope not in EXPORT_SCOPES or fmt not in exports.WRITERS:
+        raise Http404
+    if request.user.role != 'Teacher' and not request.user.is_staff:
+        raise PermissionDenied
+    obj = get_object_or_404(EXPORT_SCOPES[scope], pk=object_id)
+
+    subjects = list(exports.subjects_for(scope, obj, request.user))
+    if not subjects and not request.user.is_staff:
+        raise PermissionDenied
+
+    chunks = exports.WRITERS[fmt](subjects)
+    if hasattr(request, 'scope'):
+        # Served over ASGI
+        chunks = exports.iterate_async(chunks)
+    response = StreamingHttpResponse(chunks, content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="attendance-{scope}-{obj.pk}.{fmt}"'
+    return response
+
+
 @login_required
 def profile(request):
     return render(request, 'teacher/profile.html')
@@ -297,24 +337,26 @@ def get_teacher_subject_attendance_data(request):
     try:
         subject = Subject.objects.get(pk=subject_id)
         # Optional: Add permission check if a teacher should only access their own subjects
-        if request.user.role == 'Teacher' and subject.teacher != request.user:
+        if request.user.role == 'Teacher' and subject.teacher_id != request.user.id:
             return JsonResponse({'error': 'Permission denied.'}, status=403)
     except Subject.DoesNotExist:
         return JsonResponse({'error': 'Subject not found.'}, status=404)
 
-    total_lectures = Lecture.objects.filter(subject=subject).count()
-    total_students = subject.class_obj.students.count()
-    
-    if total_lectures == 0 or total_students == 0:
-        return JsonResponse({'present': 0, 'absent': 0})
+    def build():
+        total_lectures = summary.lecture_count(subject.id)
+        total_students = subject.class_obj.students.count()
 
-    total_possible_attendances = total_students * total_lectures
-    actual_attendances = Attendance.objects.filter(lecture__subject=subject, status='approved').count()
+        if total_lectures == 0 or total_students == 0:
+            return {'present': 0, 'absent': 0}
 
-    return JsonResponse({
-        'present': actual_attendances,
-        'absent': total_possible_attendances - actual_attendances
-    })
+        total_possible_attendances = total_students * total_lectures
+        actual_attendances = subject.student_summaries.aggregate(total=Sum('approved_count'))['total'] or 0
+        return {
+            'present': actual_attendances,
+            'absent': total_possible_attendances - actual_attendances
+        }
+
+    return reports.cached_report_response(request, 'teacher_subject_attendance', subject.id, build)
 
 
 @login_required
@@ -325,30 +367,83 @@ def get_student_attendance_percentages(request):
 
     try:
         subject = Subject.objects.get(pk=subject_id)
-        if request.user.role == 'Teacher' and subject.teacher != request.user:
+        if request.user.role == 'Teacher' and subject.teacher_id != request.user.id:
             return JsonResponse({'error': 'Permission denied.'}, status=403)
     except Subject.DoesNotExist:
         return JsonResponse({'error': 'Subject not found.'}, status=404)
 
-    total_lectures = Lecture.objects.filter(subject=subject).count()
-    if total_lectures == 0:
-        return JsonResponse({'students': []})
+    def build():
+        report = reports.build_subject_report(subject)
+        if report['total_lectures'] == 0:
+            return {'students': []}
+
+        return {'students': [
+            {
+                'name': student['student_name'],
+                'percentage': round(student['attendance_percentage'])
+            }
+            for student in report['students']
+        ]}
+
+    return reports.cached_report_response(request, 'student_attendance_percentages', subject.id, build)
 
-    students = subject.class_obj.students.all()
-    student_percentages = []
-    for student in students:
-        attended_count = Attendance.objects.filter(
-            lecture__subject=subject,
-            student=student,
-            status='approved'
-        ).count()
-        percentage = (attended_count / total_lectures) * 100 if total_lectures > 0 else 0
-        student_percentages.append({
-            'name': student.name,
-            'percentage': round(percentage)
-        })
 
-    return JsonResponse({'students': student_percentages})
+@login_required
+def get_subject_analytics(request):
+    subject_id = request.GET.get('subject_id')
+    if not subject_id:
+        return JsonResponse({'error': 'Subject ID is required.'}, status=400)
+
+    try:
+        subject = Subject.objects.select_related('class_obj').get(pk=subject_id)
+        if request.user.role != 'Teacher' or subject.teacher_id != request.user.id:
+            return JsonResponse({'error': 'Permission denied.'}, status=403)
+    except Subject.DoesNotExist:
+        return JsonResponse({'error': 'Subject not found.'}, status=404)
+
+    def build():
+        return analytics.analyse(analytics.load_matrix(subject.class_obj, subjects=[subject]))
+
+    return reports.cached_report_response(request, 'subject_analytics', subject.id, build)
+
+
+@login_required
+def get_defaulters(request):
+    """
+    Students below the attendance threshold, as of the last find_defaulters
+    run: in the subjects the teacher teaches, or every subject for staff.
+    Takes an optional subject_id.
+    """
+    if request.user.role != 'Teacher' and not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+
+    rows = Defaulter.objects.select_related('subject__class_obj', 'student').order_by(
+        'subject__class_obj__name', 'subject__name', 'percentage', 'student__name'
+    )
+    if not request.user.is_staff:
+        rows = rows.filter(subject__teacher=request.user)
+    subject_id = request.GET.get('subject_id')
+    if subject_id:
+        if not subject_id.isdigit():
+            return JsonResponse({'error': 'Invalid subject ID.'}, status=400)
+        rows = rows.filter(subject_id=subject_id)
+
+    return JsonResponse({'defaulters': [
+        {
+            'subject_id': row.subject_id,
+            'subject': row.subject.name,
+            'class': row.subject.class_obj.name,
+            'student_id': row.student_id,
+            'student_name': row.student.name,
+            'student_email': row.student.email,
+            'attended': row.attended,
+            'total_lectures': row.total_lectures,
+            'percentage': round(row.percentage, 1),
+            'threshold': row.threshold,
+            'computed_at': row.computed_at.isoformat(),
+        }
+        for row in rows
+    ]})
 
 
 @login_required
@@ -456,24 +551,16 @@ def manual_mark_attendance(request, lecture_id):
     student = get_object_or_404(CustomUser, pk=student_id, role='Student')
 
     # Check if the student is enrolled in the class
-    if not lecture.subject.class_obj.students.filter(pk=student.id).exists():
+    if not enrollment.is_enrolled(lecture.subject.class_obj_id, student.id, confirm=True):
         return JsonResponse({'success': False, 'message': 'Student not enrolled in this class.'})
 
-    # Use get_or_create to mark attendance, preventing duplicates
-    attendance, created = Attendance.objects.get_or_create(
-        student=student,
-        lecture=lecture,
-        defaults={'subject': lecture.subject, 'date': lecture.date, 'status': 'approved'}
-    )
+    # Insert an approved record, or approve the existing one, in one statement
+    attendance_id = Attendance.objects.approve(student.id, lecture.id, lecture.subject_id, lecture.date)
 
-    if created:
+    if attendance_id is not None:
         return JsonResponse({'success': True, 'message': f'Attendance marked for {student.name}.'})
     else:
-        # If attendance already existed, ensure it's marked as approved
-        if attendance.status != 'approved':
-            attendance.status = 'approved'
-            attendance.save()
-        return JsonResponse({'success': True, 'message': f'Attendance for {student.name} is now approved.'})
+        return JsonResponse({'success': True, 'message': f'Attendance for {student.name} is already approved.'})
 
 
 @login_required
@@ -486,6 +573,28 @@ def get_pending_attendance(request, lecture_id):
     if lecture.subject.teacher != request.user:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
+    # With ?since=<cursor>, return only records that changed after the cursor
+    # (in any status) so a reconnecting live page can catch up cheaply
+    since = request.GET.get('since')
+    if since:
+        try:
+            since_dt = parse_datetime(since)
+        except ValueError:  # well formatted but not a valid datetime
+            since_dt = None
+        if since_dt is None:
+            return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+        if timezone.is_naive(since_dt):
+            since_dt = timezone.make_aware(since_dt)
+        changed = list(Attendance.objects.filter(
+            lecture=lecture,
+            updated_at__gte=since_dt
+        ).select_related('student').order_by('updated_at'))
+
+        changes = [serialize_attendance_change(att) for att in changed]
+        cursor = changed[-1].updated_at.isoformat() if changed else since
+        return JsonResponse({'changes': changes, 'cursor': cursor})
+
+    cursor = timezone.now().isoformat()
     pending_attendances = Attendance.objects.filter(
         lecture=lecture,
         status='pending'
@@ -502,7 +611,18 @@ def get_pending_attendance(request, lecture_id):
         for att in pending_attendances
     ]
 
-    return JsonResponse({'pending_students': student_data})
+    return JsonResponse({'pending_students': student_data, 'cursor': cursor})
+
+
+def serialize_attendance_change(attendance):
+    return {
+        'attendance_id': attendance.id,
+        'student_id': attendance.student_id,
+        'student_name': attendance.student.name,
+        'roll_no': attendance.student.roll_no,
+        'status': attendance.status,
+        'reason': attendance.rejection_reason,
+    }
 
 
 @login_required
@@ -517,21 +637,15 @@ def approve_attendance(request, attendance_id):
     if lecture.subject.teacher != request.user:
         return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
 
-    attendance.status = 'approved'
-    attendance.save()
-    
+    Attendance.objects.set_status(attendance.id, lecture.subject_id, attendance.student_id, 'approved')
+
+    notifications.send_lecture_updates(lecture.id, [{'attendance_id': attendance.id, 'status': 'approved'}])
+
     # Notify student
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"student_{attendance.student.id}",
-        {
-            "type": "attendance_status_update",
-            "message": {
-                "subject_name": lecture.subject.name,
-                "status": "approved",
-            }
-        }
-    )
+    notifications.send_status_update(attendance.student_id, {
+        "subject_name": lecture.subject.name,
+        "status": "approved",
+    })
 
     return JsonResponse({'success': True, 'message': 'Attendance approved.'})
 
@@ -554,55 +668,140 @@ def reject_attendance(request, attendance_id):
     except json.JSONDecodeError:
         rejection_reason = 'No reason provided.'
 
-    attendance.status = 'rejected'
-    attendance.rejection_reason = rejection_reason
-    attendance.save()
+    Attendance.objects.set_status(attendance.id, lecture.subject_id, attendance.student_id, 'rejected', rejection_reason)
+
+    notifications.send_lecture_updates(lecture.id, [
+        {'attendance_id': attendance.id, 'status': 'rejected', 'reason': rejection_reason}
+    ])
 
     # Notify student
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"student_{attendance.student.id}",
-        {
-            "type": "attendance_status_update",
-            "message": {
-                "subject_name": lecture.subject.name,
-                "status": "rejected",
-                "reason": rejection_reason,
-            }
-        }
-    )
+    notifications.send_status_update(attendance.student_id, {
+        "subject_name": lecture.subject.name,
+        "status": "rejected",
+        "reason": rejection_reason,
+    })
 
     return JsonResponse({'success': True, 'message': 'Attendance rejected.'})
 
+BULK_UPDATE_LIMIT = 500
+
+@login_required
+@require_POST
+def bulk_update_attendance(request):
+    """
+    Approves or rejects many attendance records at once. Expects
+    {"changes": [{"id": 1, "action": "approve"},
+                 {"id": 2, "action": "reject", "reason": "..."}]}
+    and returns a result for each id. Changes that can't be applied are
+    reported in their result without affecting the others.
+    """
+    if request.user.role != 'Teacher':
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    try:
+        changes = json.loads(request.body).get('changes')
+    except (json.JSONDecodeError, AttributeError):
+        changes = None
+    if not isinstance(changes, list) or not changes:
+        return JsonResponse({'success': False, 'message': 'Expected a non-empty list of changes.'}, status=400)
+    if len(changes) > BULK_UPDATE_LIMIT:
+        return JsonResponse({'success': False, 'message': f'At most {BULK_UPDATE_LIMIT} changes can be applied at once.'}, status=400)
+
+    results = []
+    requested = {}
+    for change in changes:
+        attendance_id = change.get('id') if isinstance(change, dict) else None
+        result = {'id': attendance_id, 'success': False}
+        results.append(result)
+        # type() rather than isinstance(), which would accept true and false
+        if type(attendance_id) is not int:
+            result['message'] = 'Invalid attendance id.'
+        elif attendance_id in requested:
+            result['message'] = 'Duplicate attendance id.'
+        elif change.get('action') not in ('approve', 'reject'):
+            result['message'] = "Action must be 'approve' or 'reject'."
+        elif not isinstance(change.get('reason'), (str, type(None))):
+            result['message'] = 'Invalid rejection reason.'
+        elif len(change.get('reason') or '') > Attendance._meta.get_field('rejection_reason').max_length:
+            result['message'] = 'Rejection reason is too long.'
+        else:
+            requested[attendance_id] = (change['action'], change.get('reason') or 'No reason provided.', result)
+
+    approve_ids, reject_reasons = [], {}
+    with transaction.atomic():
+        # Ownership is checked for every id in a single query
+        owned = {
+            row[0]: row[1:] for row in Attendance.objects.select_for_update(of=('self',)).filter(
+                pk__in=requested, lecture__subject__teacher=request.user
+            ).values_list('id', 'student_id', 'lecture_id', 'lecture__subject__name', 'lecture__subject_id', 'status')
+        }
+
+        for attendance_id, (action, reason, result) in requested.items():
+            if attendance_id not in owned:
+                result['message'] = 'Attendance not found.'
+            elif action == 'approve':
+                approve_ids.append(attendance_id)
+            else:
+                reject_reasons[attendance_id] = reason
+
+        if owned:
+            Attendance.objects.filter(pk__in=owned).update(
+                status=Case(When(pk__in=approve_ids, then=Value('approved')), default=Value('rejected')),
+                rejection_reason=Case(
+                    *(When(pk=attendance_id, then=Value(reason)) for attendance_id, reason in reject_reasons.items()),
+                    default=Value(None)
+                ),
+                updated_at=timezone.now(),
+            )
+
+            # Keep approved totals in step; approving twice is a no-op
+            approved_ids = set(approve_ids)
+            deltas = {}
+            for attendance_id, (student_id, _, _, subject_id, status) in owned.items():
+                change = (attendance_id in approved_ids) - (status == 'approved')
+                key = (subject_id, student_id)
+                deltas[key] = deltas.get(key, 0) + change
+            summary.add_approved(deltas)
+
+    lecture_updates, status_messages = {}, []
+    for attendance_id, (action, reason, result) in requested.items():
+        if attendance_id not in owned:
+            continue
+        student_id, lecture_id, subject_name = owned[attendance_id][:3]
+        status = 'approved' if action == 'approve' else 'rejected'
+        result.update(success=True, status=status)
+        update = {'attendance_id': attendance_id, 'status': status}
+        message = {"subject_name": subject_name, "status": status}
+        if status == 'rejected':
+            update['reason'] = message['reason'] = reason
+        lecture_updates.setdefault(lecture_id, []).append(update)
+        status_messages.append((student_id, message))
+
+    for lecture_id, updates in lecture_updates.items():
+        notifications.send_lecture_updates(lecture_id, updates)
+    notifications.send_status_messages(status_messages)
+
+    return JsonResponse({'success': True, 'results': results})
+
 @login_required
 @require_POST
 def approve_all_attendance(request, lecture_id):
     if request.user.role != 'Teacher':
         return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
 
-    lecture = get_object_or_404(Lecture, pk=lecture_id)
+    lecture = get_object_or_404(Lecture.objects.select_related('subject'), pk=lecture_id)
 
-    if lecture.subject.teacher != request.user:
+    if lecture.subject.teacher_id != request.user.id:
         return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
 
-    pending_attendances = Attendance.objects.filter(lecture=lecture, status='pending')
-    
-    for attendance in pending_attendances:
-        attendance.status = 'approved'
-        attendance.save()
-        
-        # Notify student
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"student_{attendance.student.id}",
-            {
-                "type": "attendance_status_update",
-                "message": {
-                    "subject_name": lecture.subject.name,
-                    "status": "approved",
-                }
-            }
-        )
+    approved = Attendance.objects.approve_pending(lecture)
 
-    return JsonResponse({'success': True, 'message': 'All pending attendances have been approved.'})
+    notifications.send_lecture_updates(lecture.id, [
+        {'attendance_id': attendance_id, 'status': 'approved'} for attendance_id, _ in approved
+    ])
+    notifications.send_status_updates([student_id for _, student_id in approved], {
+        "subject_name": lecture.subject.name,
+        "status": "approved",
+    })
 
+    return JsonResponse({'success': True, 'message': 'All pending attendances have been approved.'})